@@ -0,0 +1,29 @@
+"""add transaction and goal indexes"""
+
+from alembic import op
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_tx_user_cat_type "
+        "ON transactions(user_id, category_id, type)"
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_tx_user_created "
+        "ON transactions(user_id, created_at DESC)"
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_goals_user "
+        "ON goals(user_id, category_id)"
+    )
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_goals_user")
+    op.execute("DROP INDEX IF EXISTS idx_tx_user_created")
+    op.execute("DROP INDEX IF EXISTS idx_tx_user_cat_type")
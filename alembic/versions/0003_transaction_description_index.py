@@ -0,0 +1,19 @@
+"""add transaction description index"""
+
+from alembic import op
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_tx_desc "
+        "ON transactions(description)"
+    )
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_tx_desc")
@@ -0,0 +1,28 @@
+"""keep monthly expenses and transactions in sync on delete"""
+
+from alembic import op
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        "CREATE TRIGGER IF NOT EXISTS trg_tx_delete "
+        "AFTER DELETE ON transactions BEGIN "
+        "DELETE FROM monthly_expenses WHERE description = OLD.description; "
+        "END"
+    )
+    op.execute(
+        "CREATE TRIGGER IF NOT EXISTS trg_monthly_expense_delete "
+        "AFTER DELETE ON monthly_expenses BEGIN "
+        "DELETE FROM transactions WHERE description = OLD.description; "
+        "END"
+    )
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS trg_monthly_expense_delete")
+    op.execute("DROP TRIGGER IF EXISTS trg_tx_delete")
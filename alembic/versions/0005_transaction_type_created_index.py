@@ -0,0 +1,19 @@
+"""add transaction (user, type, created_at) index"""
+
+from alembic import op
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_tx_user_type_created "
+        "ON transactions(user_id, type, created_at DESC)"
+    )
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_tx_user_type_created")
@@ -0,0 +1,19 @@
+"""add transaction (user, type, category) index"""
+
+from alembic import op
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_tx_user_type_cat "
+        "ON transactions(user_id, type, category_id)"
+    )
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_tx_user_type_cat")
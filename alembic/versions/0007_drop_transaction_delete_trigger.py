@@ -0,0 +1,26 @@
+"""drop the transaction delete trigger
+
+trg_tx_delete removed monthly expenses whenever any transaction with a
+matching description was deleted, including category and income deletes.
+The /delete/<id> route now does that cleanup itself.
+"""
+
+from alembic import op
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("DROP TRIGGER IF EXISTS trg_tx_delete")
+
+
+def downgrade():
+    op.execute(
+        "CREATE TRIGGER IF NOT EXISTS trg_tx_delete "
+        "AFTER DELETE ON transactions BEGIN "
+        "DELETE FROM monthly_expenses WHERE description = OLD.description; "
+        "END"
+    )
@@ -45,10 +45,10 @@ def accounts():
         accounts = []
         for r in rows:
             accounts.append({
-                'name': r['name'],
-                'balance': r['balance'],
-                'payment': r['monthly_payment'],
-                'type': r['type'],
+                'name': r.name,
+                'balance': r.balance,
+                'payment': r.monthly_payment,
+                'type': r.type,
             })
         return jsonify(accounts)
     data = request.get_json() or {}
@@ -78,7 +78,7 @@ def transactions():
             FROM transactions t
             JOIN categories c ON t.category_id = c.id
             WHERE t.user_id=?
-            ORDER BY t.created_at DESC
+            ORDER BY t.created_at DESC, t.id DESC
             LIMIT ?
             """,
             (user_id, limit),
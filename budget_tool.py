@@ -3,15 +3,20 @@
 
 import argparse
 import csv
+import itertools
 import os
 import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
 from urllib.parse import urlparse
 from pathlib import Path
 from datetime import datetime, timedelta
 import math
-import io
+from collections import namedtuple
 from dataclasses import dataclass
-from typing import Sequence
+from functools import lru_cache
+from typing import Iterable, Iterator, Sequence
 
 
 def fmt(amount: float) -> str:
@@ -29,6 +34,29 @@ DEFAULT_DB = Path(__file__).with_name("budget.db")
 DB_FILE = Path(os.environ.get("BUDGET_DB", DEFAULT_DB))
 SQLITE_KEY = os.environ.get("SQLITE_KEY")
 DATABASE_URL = os.environ.get("DATABASE_URL")
+# bump whenever init_db gains new tables, columns or indexes
+SCHEMA_VERSION = 7
+# database keys whose schema has already been verified in this process
+_INITED: set[str] = set()
+# prepared statements kept per connection (sqlite3 defaults to 128)
+_STATEMENT_CACHE = 256
+# user ids by (database key, username); users are never deleted or renamed
+_USER_IDS: dict[tuple[str, str], int] = {}
+# per-thread SQLite connection reused by get_connection()
+_CONN = threading.local()
+# applied once when a cached connection is opened
+_CONNECTION_PRAGMAS = (
+    "PRAGMA foreign_keys=ON",
+    # with WAL, NORMAL only syncs at checkpoints and is still crash-safe
+    "PRAGMA synchronous=NORMAL",
+    # read pages through a 256 MiB memory map and keep ~20 MB cached
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-20000",
+    # wait for a competing writer instead of failing with "database is locked"
+    "PRAGMA busy_timeout=5000",
+)
+# ISO-8601 local timestamp formatted by SQLite instead of Python
+_NOW_SQL = "strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime')"
 if SQLITE_KEY:
     try:
         import pysqlcipher3.dbapi2 as sqlcipher  # type: ignore
@@ -46,6 +74,25 @@ class TransactionRecord:
     category: str | None = None
 
 
+# header names recognized as the transaction date, in order of preference
+_DATE_COLUMNS = ("date", "posting date", "effective date", "transaction date")
+_DATE_FORMATS = ("%Y-%m-%d", "%Y%m%d", "%m/%d/%Y")
+
+
+def _parse_date(text: str) -> datetime | None:
+    """Return ``text`` parsed with the first matching date format."""
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        pass
+    for date_format in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format)
+        except ValueError:
+            pass
+    return None
+
+
 def parse_statement_csv(path_or_file) -> list[TransactionRecord]:
     """Parse a simple CSV bank statement and return records."""
     close = False
@@ -66,62 +113,46 @@ def parse_statement_csv(path_or_file) -> list[TransactionRecord]:
         except csv.Error:
             delimiter = ","
         reader = csv.reader(f, delimiter=delimiter)
-        rows = list(reader)
+        # rows are parsed as they are read; the file is never held as a list
+        first = next(reader, None)
+        if first is None:
+            return []
+        return _statement_records(first, reader)
     finally:
         if close:
             f.close()
 
-    if not rows:
-        return []
 
-    header = [c.lower().strip() for c in rows[0]]
+def _statement_records(
+    first: list[str], rows: Iterable[list[str]]
+) -> list[TransactionRecord]:
+    """Build records from a statement's first row and its remaining rows."""
+    header = [c.lower().strip() for c in first]
     has_header = "amount" in header and "description" in header
-    start = 1 if has_header else 0
-    category_key = None
+    if not has_header:
+        rows = itertools.chain((first,), rows)
+    # resolve column positions once rather than re-mapping every row
+    date_i, desc_i, amt_i, cat_i = 0, 1, 2, None
     if has_header:
+        index = {h: i for i, h in enumerate(header)}
+        for key in _DATE_COLUMNS:
+            if key in index:
+                date_i = index[key]
+                break
+        desc_i = index["description"]
+        amt_i = index["amount"]
         for h in header:
             if "category" in h:
-                category_key = h
+                cat_i = index[h]
                 break
 
     records: list[TransactionRecord] = []
-    for row in rows[start:]:
+    for row in rows:
         if len(row) < 3:
             continue
-        if has_header:
-            mapping = {header[i]: row[i] for i in range(len(header))}
-            date_key = None
-            for key in [
-                "date",
-                "posting date",
-                "effective date",
-                "transaction date",
-            ]:
-                if key in header:
-                    date_key = key
-                    break
-            if date_key:
-                date_str = mapping.get(date_key, row[0])
-            else:
-                date_str = row[0]
-            desc = mapping.get("description", row[1])
-            amt_str = mapping.get("amount", row[2])
-            category = mapping.get(category_key) if category_key else None
-        else:
-            date_str, desc, amt_str = row[0], row[1], row[2]
-            category = None
-        dt = None
-        for fmt in [
-            lambda s: datetime.fromisoformat(s),
-            lambda s: datetime.strptime(s, "%Y-%m-%d"),
-            lambda s: datetime.strptime(s, "%Y%m%d"),
-            lambda s: datetime.strptime(s, "%m/%d/%Y"),
-        ]:
-            try:
-                dt = fmt(date_str)
-                break
-            except ValueError:
-                pass
+        date_str, desc, amt_str = row[date_i], row[desc_i], row[amt_i]
+        category = row[cat_i] if cat_i is not None else None
+        dt = _parse_date(date_str)
         if dt is None:
             continue
         amt = float(amt_str.replace("$", "").replace(",", ""))
@@ -182,6 +213,14 @@ def find_recurring_expenses(
     return recurring
 
 
+# account rows as returned by get_all_accounts; attribute access is much
+# cheaper than sqlite3.Row string lookups in the forecast loops
+Account = namedtuple(
+    "Account",
+    "name balance monthly_payment type apr escrow insurance tax",
+)
+
+
 class _PGWrapper:
     """Simple wrapper to provide sqlite-like API for psycopg2 connections."""
 
@@ -196,6 +235,9 @@ class _PGWrapper:
     def commit(self):
         self._conn.commit()
 
+    def rollback(self):
+        self._conn.rollback()
+
     def cursor(self):
         return self._conn.cursor()
 
@@ -216,25 +258,122 @@ def get_connection():
             return _PGWrapper(conn)
         elif parsed.scheme.startswith("sqlite"):
             path = parsed.path or "budget.db"
-            conn = sqlite3.connect(path)
+            conn = sqlite3.connect(
+                path, cached_statements=_STATEMENT_CACHE
+            )
         else:
             raise RuntimeError("Unsupported DATABASE_URL scheme")
     else:
         if SQLITE_KEY:
             if sqlcipher is None:
                 raise RuntimeError("pysqlcipher3 is required for encrypted databases")
-            conn = sqlcipher.connect(DB_FILE)
+            conn = sqlcipher.connect(
+                DB_FILE, cached_statements=_STATEMENT_CACHE
+            )
             conn.execute(f"PRAGMA key='{SQLITE_KEY}'")
         else:
-            conn = sqlite3.connect(DB_FILE)
+            return _cached_connection()
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA foreign_keys=ON")
     return conn
 
 
+class _CachedConnection(sqlite3.Connection):
+    """SQLite connection that stays open between get_connection() calls.
+
+    ``close()`` only discards an unfinished transaction so callers can keep
+    their usual open/close pattern; close_connection() really closes it.
+    """
+
+    def close(self):
+        if self.in_transaction:
+            self.rollback()
+
+
+def _cached_connection() -> _CachedConnection:
+    """Return this thread's connection to DB_FILE, opening it if needed."""
+    key = str(DB_FILE)
+    conn = getattr(_CONN, "conn", None)
+    if conn is not None and _CONN.key == key:
+        return conn
+    close_connection()
+    # autocommit: writers open their own transactions via transaction()
+    conn = sqlite3.connect(
+        DB_FILE,
+        factory=_CachedConnection,
+        cached_statements=_STATEMENT_CACHE,
+        isolation_level=None,
+    )
+    conn.row_factory = sqlite3.Row
+    for pragma in _CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    _CONN.conn = conn
+    _CONN.key = key
+    return conn
+
+
+def close_connection() -> None:
+    """Close the connection cached for the current thread, if any."""
+    conn = getattr(_CONN, "conn", None)
+    if conn is not None:
+        sqlite3.Connection.close(conn)
+        _CONN.conn = None
+
+
+@contextmanager
+def transaction(conn):
+    """Run the enclosed writes as one transaction on ``conn``.
+
+    Autocommit SQLite connections take the write lock up front with
+    ``BEGIN IMMEDIATE`` instead of upgrading a deferred transaction halfway
+    through. Other connections fall back to commit/rollback. Nested use
+    inside an open transaction leaves committing to the outer block.
+    """
+    if getattr(conn, "in_transaction", False):
+        yield conn
+        return
+    explicit = getattr(conn, "isolation_level", "") is None
+    if explicit:
+        conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    if explicit:
+        conn.execute("COMMIT")
+    else:
+        conn.commit()
+
+
+def _db_key() -> str:
+    """Return a key identifying the database currently in use."""
+    return DATABASE_URL or str(DB_FILE)
+
+
 def init_db():
-    """Create database tables and ensure a default user exists."""
+    """Create database tables and ensure a default user exists.
+
+    The schema is only (re)built when the database's ``user_version`` is
+    older than ``SCHEMA_VERSION``; once verified for a database, further
+    calls in the same process return immediately.
+    """
+    key = _db_key()
+    if key in _INITED:
+        return
     conn = get_connection()
+    is_sqlite = not isinstance(conn, _PGWrapper)
+    if is_sqlite:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            conn.close()
+            _INITED.add(key)
+            return
+        # readers no longer block the writer and commits need fewer fsyncs
+        conn.execute("PRAGMA journal_mode=WAL")
+    # a database being (re)built may reuse a path with different user ids
+    for cached in [k for k in _USER_IDS if k[0] == key]:
+        del _USER_IDS[cached]
     cur = conn.cursor()
     cur.execute(
         """CREATE TABLE IF NOT EXISTS users (
@@ -250,7 +389,7 @@ def init_db():
             )"""
     )
     cur.execute(
-        """CREATE TABLE IF NOT EXISTS transactions (
+        f"""CREATE TABLE IF NOT EXISTS transactions (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 category_id INTEGER NOT NULL,
                 user_id INTEGER NOT NULL,
@@ -258,7 +397,7 @@ def init_db():
                 type TEXT CHECK(type IN ('income','expense')) NOT NULL,
                 description TEXT,
                 item_name TEXT,
-                created_at TEXT NOT NULL,
+                created_at TEXT NOT NULL DEFAULT ({_NOW_SQL}),
                 FOREIGN KEY(category_id) REFERENCES categories(id),
                 FOREIGN KEY(user_id) REFERENCES users(id)
             )"""
@@ -337,18 +476,62 @@ def init_db():
         cur.execute("ALTER TABLE accounts ADD COLUMN insurance REAL DEFAULT 0")
     if "tax" not in acct_cols:
         cur.execute("ALTER TABLE accounts ADD COLUMN tax REAL DEFAULT 0")
+    # indexes for the per-user/per-category lookups used by most queries
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_tx_user_cat_type "
+        "ON transactions(user_id, category_id, type)"
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_tx_user_created "
+        "ON transactions(user_id, created_at DESC)"
+    )
+    # newest-first expense/income listings filtered by type
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_tx_user_type_created "
+        "ON transactions(user_id, type, created_at DESC)"
+    )
+    # per-category expense totals for the dashboard chart
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_tx_user_type_cat "
+        "ON transactions(user_id, type, category_id)"
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_goals_user "
+        "ON goals(user_id, category_id)"
+    )
+    # monthly expense deletes remove their transactions by description
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_tx_desc ON transactions(description)"
+    )
+    # deleting a monthly expense removes its transactions; INSERT OR REPLACE
+    # does not fire this while recursive_triggers is off
+    cur.execute(
+        "CREATE TRIGGER IF NOT EXISTS trg_monthly_expense_delete "
+        "AFTER DELETE ON monthly_expenses BEGIN "
+        "DELETE FROM transactions WHERE description = OLD.description; "
+        "END"
+    )
+    # schema 4-6 also dropped monthly expenses on every transaction delete,
+    # including category and income deletes; only /delete/<id> should
+    cur.execute("DROP TRIGGER IF EXISTS trg_tx_delete")
     # ensure default user exists
     cur.execute("INSERT OR IGNORE INTO users(username) VALUES('default')")
+    if is_sqlite:
+        cur.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+    # only non-autocommit backends hold anything here; on the cached SQLite
+    # connection every statement above is idempotent and user_version is
+    # written last, so an interrupted build is simply redone
     conn.commit()
     conn.close()
+    _INITED.add(key)
 
 
 def add_category(name: str):
     """Add a new spending category."""
     conn = get_connection()
     try:
-        conn.execute("INSERT INTO categories(name) VALUES(?)", (name,))
-        conn.commit()
+        with transaction(conn):
+            conn.execute("INSERT INTO categories(name) VALUES(?)", (name,))
         print(f"Category '{name}' added.")
     except sqlite3.IntegrityError:
         print(f"Category '{name}' already exists.")
@@ -356,9 +539,29 @@ def add_category(name: str):
         conn.close()
 
 
-def calc_totals(user: str = "default") -> tuple[float, float, float]:
-    """Return total income, expense and net for a user."""
+def add_category_if_missing(name: str) -> bool:
+    """Quietly create a category, returning whether it was new."""
     conn = get_connection()
+    try:
+        with transaction(conn):
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO categories(name) VALUES(?)", (name,)
+            )
+    finally:
+        conn.close()
+    return cur.rowcount > 0
+
+
+def calc_totals(
+    user: str = "default", conn=None
+) -> tuple[float, float, float]:
+    """Return total income, expense and net for a user.
+
+    ``conn`` may be an open connection to reuse; it is left open.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
     user_id = get_user_id(conn, user)
     cur = conn.execute(
         (
@@ -368,40 +571,66 @@ def calc_totals(user: str = "default") -> tuple[float, float, float]:
         (user_id,),
     )
     totals = {row[0]: row[1] or 0 for row in cur.fetchall()}
-    conn.close()
+    if own_conn:
+        conn.close()
     income = totals.get("income", 0)
     expense = totals.get("expense", 0)
     return income, expense, income - expense
 
 
-def total_bank_balance() -> float:
+def total_bank_balance(conn=None) -> float:
     """Return the sum of all bank account balances."""
-    conn = get_connection()
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
     cur = conn.execute("SELECT balance FROM accounts WHERE type='Bank'")
     total = sum(r[0] for r in cur.fetchall())
-    conn.close()
+    if own_conn:
+        conn.close()
     return total
 
 
-def total_asset_balance() -> float:
+def total_asset_balance(conn=None) -> float:
     """Return the sum of balances for bank, crypto and stock accounts."""
-    conn = get_connection()
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
     cur = conn.execute(
         "SELECT balance FROM accounts WHERE type IN ('Bank','Crypto Wallet','Stock Account')"  # noqa: E501
     )
     total = sum(r[0] for r in cur.fetchall())
-    conn.close()
+    if own_conn:
+        conn.close()
     return total
 
 
-def get_all_accounts():
+def get_asset_accounts_sql(conn=None) -> list[sqlite3.Row]:
+    """Return name, balance and type of bank, crypto and stock accounts."""
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    cur = conn.execute(
+        "SELECT name, balance, type FROM accounts "
+        "WHERE type IN ('Bank','Crypto Wallet','Stock Account') "
+        "ORDER BY name"
+    )
+    rows = cur.fetchall()
+    if own_conn:
+        conn.close()
+    return rows
+
+
+def get_all_accounts(conn=None) -> list[Account]:
     """Return list of all account records."""
-    conn = get_connection()
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
     cur = conn.execute(
         "SELECT name, balance, monthly_payment, type, apr, escrow, insurance, tax FROM accounts ORDER BY name"  # noqa: E501
     )
-    rows = cur.fetchall()
-    conn.close()
+    rows = [Account._make(r) for r in cur.fetchall()]
+    if own_conn:
+        conn.close()
     return rows
 
 
@@ -420,20 +649,54 @@ def account_balance_after_months(
     tax: float = 0.0,
     months: int = 1,
 ) -> float:
-    """Return projected balance after a number of months."""
+    """Return projected balance after a number of months.
+
+    Uses the closed-form annuity formula, so the cost does not grow with
+    ``months``.
+    """
+    if months <= 0:
+        return balance
     rate = apr / 12 / 100
     principal_payment = payment - escrow - insurance - tax
-    for _ in range(months):
-        balance = balance * (1 + rate) - principal_payment
-    return balance
+    if rate == 0:
+        return balance - principal_payment * months
+    growth = (1 + rate) ** months
+    return balance * growth - principal_payment * (growth - 1) / rate
+
+
+def forecast_balances(
+    balances: Sequence[float],
+    payments: Sequence[float],
+    aprs: Sequence[float],
+    escrows: Sequence[float],
+    insurances: Sequence[float],
+    taxes: Sequence[float],
+    months: int,
+) -> list[float]:
+    """Return account_balance_after_months() for many accounts at once.
+
+    Callers pass the account columns once and get one balance per account.
+    """
+    return [
+        account_balance_after_months(b, p, a, e, i, t, months)
+        for b, p, a, e, i, t in zip(
+            balances, payments, aprs, escrows, insurances, taxes
+        )
+    ]
 
 
-def months_until_bank_negative(user: str = "default") -> int | None:
-    """Return months until bank balance drops below zero if net is negative."""
-    _, _, net = calc_totals(user)
+def months_until_bank_negative(
+    user: str = "default", conn=None, net: float | None = None
+) -> int | None:
+    """Return months until bank balance drops below zero if net is negative.
+
+    Pass ``net`` when the totals are already known to skip recomputing them.
+    """
+    if net is None:
+        _, _, net = calc_totals(user, conn)
     if net >= 0:
         return None
-    bank = total_bank_balance()
+    bank = total_bank_balance(conn)
     if bank <= 0:
         return 0
     return math.ceil(bank / -net)
@@ -449,9 +712,11 @@ def delete_category(name: str) -> None:
             print(f"Category '{name}' not found.")
             return
         cat_id = row[0]
-        conn.execute("DELETE FROM transactions WHERE category_id=?", (cat_id,))
-        conn.execute("DELETE FROM categories WHERE id=?", (cat_id,))
-        conn.commit()
+        with transaction(conn):
+            conn.execute(
+                "DELETE FROM transactions WHERE category_id=?", (cat_id,)
+            )
+            conn.execute("DELETE FROM categories WHERE id=?", (cat_id,))
         print(f"Category '{name}' deleted.")
     finally:
         conn.close()
@@ -461,22 +726,60 @@ def rename_category(old_name: str, new_name: str) -> None:
     """Rename a category while preserving transactions."""
     conn = get_connection()
     try:
-        conn.execute(
-            "UPDATE categories SET name=? WHERE name=?",
-            (new_name, old_name),
-        )
-        conn.commit()
+        with transaction(conn):
+            conn.execute(
+                "UPDATE categories SET name=? WHERE name=?",
+                (new_name, old_name),
+            )
         print(f"Category '{old_name}' renamed to '{new_name}'.")
     finally:
         conn.close()
 
 
+def update_categories(
+    deletes: Iterable[str] = (),
+    renames: Iterable[tuple[str, str]] = (),
+) -> None:
+    """Delete and rename categories in a single transaction.
+
+    ``renames`` are ``(old_name, new_name)`` pairs. As with
+    delete_category(), deleting a category also removes its transactions.
+    """
+    names = list(dict.fromkeys(deletes))
+    pairs = [(new, old) for old, new in renames]
+    if not names and not pairs:
+        return
+    conn = get_connection()
+    try:
+        with transaction(conn):
+            if names:
+                placeholders = ",".join("?" * len(names))
+                conn.execute(
+                    "DELETE FROM transactions WHERE category_id IN ("
+                    f"SELECT id FROM categories WHERE name IN ({placeholders}))",  # noqa: E501
+                    names,
+                )
+                conn.execute(
+                    f"DELETE FROM categories WHERE name IN ({placeholders})",
+                    names,
+                )
+            if pairs:
+                conn.executemany(
+                    "UPDATE categories SET name=? WHERE name=?", pairs
+                )
+    finally:
+        conn.close()
+
+
 def add_user(username: str):
     """Create a new user account."""
     conn = get_connection()
     try:
-        conn.execute("INSERT INTO users(username) VALUES(?)", (username,))
-        conn.commit()
+        with transaction(conn):
+            cur = conn.execute(
+                "INSERT INTO users(username) VALUES(?)", (username,)
+            )
+        _USER_IDS[(_db_key(), username)] = cur.lastrowid
         print(f"User '{username}' added.")
     except sqlite3.IntegrityError:
         print(f"User '{username}' already exists.")
@@ -496,25 +799,23 @@ def set_account(
 ) -> None:
     """Add or update an account with details."""
     conn = get_connection()
-    conn.execute(
-        (
-            "INSERT INTO accounts(name, balance, monthly_payment, type, apr, escrow, insurance, tax) "  # noqa: E501
-            "VALUES(?,?,?,?,?,?,?,?) "
-            "ON CONFLICT(name) DO UPDATE SET balance=excluded.balance, "
-            "monthly_payment=excluded.monthly_payment, type=excluded.type, "
-            "apr=excluded.apr, escrow=excluded.escrow, insurance=excluded.insurance, tax=excluded.tax"  # noqa: E501
-        ),
-        (name, balance, payment, acct_type, apr, escrow, insurance, tax),
-    )
-    conn.commit()
+    with transaction(conn):
+        conn.execute(
+            (
+                "INSERT INTO accounts(name, balance, monthly_payment, type, apr, escrow, insurance, tax) "  # noqa: E501
+                "VALUES(?,?,?,?,?,?,?,?) "
+                "ON CONFLICT(name) DO UPDATE SET balance=excluded.balance, "
+                "monthly_payment=excluded.monthly_payment, type=excluded.type, "  # noqa: E501
+                "apr=excluded.apr, escrow=excluded.escrow, insurance=excluded.insurance, tax=excluded.tax"  # noqa: E501
+            ),
+            (name, balance, payment, acct_type, apr, escrow, insurance, tax),
+        )
     conn.close()
     print(f"Account '{name}' set to {fmt(balance)} with payment {fmt(payment)}")  # noqa: E501
 
     if acct_type == "Mortgage" and payment:
-        try:
-            add_category("Mortgage Payment")
-        except Exception:
-            pass
+        if add_category_if_missing("Mortgage Payment"):
+            print("Category 'Mortgage Payment' added.")
         add_transaction(
             "Mortgage Payment",
             payment,
@@ -526,8 +827,8 @@ def set_account(
 def delete_account(name: str) -> None:
     """Remove an account from the database."""
     conn = get_connection()
-    cur = conn.execute("DELETE FROM accounts WHERE name=?", (name,))
-    conn.commit()
+    with transaction(conn):
+        cur = conn.execute("DELETE FROM accounts WHERE name=?", (name,))
     conn.close()
     if cur.rowcount:
         print(f"Account '{name}' deleted.")
@@ -569,24 +870,20 @@ def add_monthly_expense(
     """Insert or replace a monthly expense and create a transaction if needed."""  # noqa: E501
     amount = abs(amount)
     conn = get_connection()
-    conn.execute(
-        "INSERT OR REPLACE INTO monthly_expenses(description, amount) VALUES(?,?)",  # noqa: E501
-        (desc, amount),
-    )
-    cur = conn.execute(
-        "SELECT 1 FROM transactions WHERE description=?", (desc,)
-    )
-    exists = cur.fetchone() is not None
-    conn.commit()
+    with transaction(conn):
+        conn.execute(
+            "INSERT OR REPLACE INTO monthly_expenses(description, amount) VALUES(?,?)",  # noqa: E501
+            (desc, amount),
+        )
+        cur = conn.execute(
+            "SELECT 1 FROM transactions WHERE description=?", (desc,)
+        )
+        exists = cur.fetchone() is not None
     conn.close()
 
     if not exists:
-        conn = get_connection()
-        cur = conn.execute("SELECT 1 FROM categories WHERE name=?", (category,))  # noqa: E501
-        cat_exists = cur.fetchone() is not None
-        conn.close()
-        if not cat_exists:
-            add_category(category)
+        if add_category_if_missing(category):
+            print(f"Category '{category}' added.")
         # ensure the user parameter is passed correctly
         add_transaction(category, amount, "expense", desc, user=user)
 
@@ -625,12 +922,37 @@ def get_monthly_expense_amount(desc: str) -> float | None:
     return row[0] if row else None
 
 
+_EXTRA_PAYMENT_PREFIX = "Extra Payment - "
+
+
+def get_extra_payments(conn=None) -> dict[str, float]:
+    """Return monthly extra payment amounts keyed by account name.
+
+    One query replaces a get_monthly_expense_amount() call per account.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    cur = conn.execute(
+        "SELECT description, amount FROM monthly_expenses "
+        "WHERE substr(description, 1, ?) = ?",
+        (len(_EXTRA_PAYMENT_PREFIX), _EXTRA_PAYMENT_PREFIX),
+    )
+    start = len(_EXTRA_PAYMENT_PREFIX)
+    extras = {desc[start:]: amount for desc, amount in cur}
+    if own_conn:
+        conn.close()
+    return extras
+
+
 def delete_monthly_expense(desc: str) -> None:
     """Delete a monthly expense and matching transactions."""
+    # trg_monthly_expense_delete removes the transactions
     conn = get_connection()
-    conn.execute("DELETE FROM monthly_expenses WHERE description=?", (desc,))
-    conn.execute("DELETE FROM transactions WHERE description=?", (desc,))
-    conn.commit()
+    with transaction(conn):
+        conn.execute(
+            "DELETE FROM monthly_expenses WHERE description=?", (desc,)
+        )
     conn.close()
 
 
@@ -654,27 +976,20 @@ def add_monthly_income(
     """Insert or replace a monthly income and create a transaction if needed."""
     amount = abs(amount)
     conn = get_connection()
-    conn.execute(
-        "INSERT OR REPLACE INTO monthly_incomes(description, amount) VALUES(?,?)",
-        (desc, amount),
-    )
-    cur = conn.execute(
-        "SELECT 1 FROM transactions WHERE description=?", (desc,)
-    )
-    exists = cur.fetchone() is not None
-    conn.commit()
+    with transaction(conn):
+        conn.execute(
+            "INSERT OR REPLACE INTO monthly_incomes(description, amount) VALUES(?,?)",  # noqa: E501
+            (desc, amount),
+        )
+        cur = conn.execute(
+            "SELECT 1 FROM transactions WHERE description=?", (desc,)
+        )
+        exists = cur.fetchone() is not None
     conn.close()
 
     if not exists:
-        conn = get_connection()
-        cur = conn.execute(
-            "SELECT 1 FROM categories WHERE name=?",
-            (category,),
-        )
-        cat_exists = cur.fetchone() is not None
-        conn.close()
-        if not cat_exists:
-            add_category(category)
+        if add_category_if_missing(category):
+            print(f"Category '{category}' added.")
         add_transaction(category, amount, "income", desc, user=user)
 
 
@@ -692,29 +1007,69 @@ def get_monthly_incomes() -> list[tuple[str, float]]:
 def delete_monthly_income(desc: str) -> None:
     """Delete a monthly income and matching transactions."""
     conn = get_connection()
-    conn.execute("DELETE FROM monthly_incomes WHERE description=?", (desc,))
-    conn.execute("DELETE FROM transactions WHERE description=?", (desc,))
-    conn.commit()
+    with transaction(conn):
+        conn.execute(
+            "DELETE FROM monthly_incomes WHERE description=?", (desc,)
+        )
+        conn.execute("DELETE FROM transactions WHERE description=?", (desc,))
     conn.close()
 
 
+_SQL_ADD_ONE_TIME = """
+    INSERT OR IGNORE INTO one_time_expenses(description, amount, created_at)
+    SELECT ?, ?, ? WHERE NOT EXISTS (
+        SELECT 1 FROM one_time_expenses
+        WHERE description=? AND amount=? AND substr(created_at,1,10)=?
+    )
+"""
+
+
 def add_one_time_expense(desc: str, amount: float, created_at: datetime) -> None:
     """Store a non-recurring expense record."""
-    date_part = created_at.date().isoformat()
+    amount = abs(amount)
+    day = created_at.date().isoformat()
     conn = get_connection()
-    cur = conn.execute(
-        "SELECT 1 FROM one_time_expenses WHERE description=? AND amount=? "
-        "AND substr(created_at,1,10)=?",
-        (desc, abs(amount), date_part),
-    )
-    exists = cur.fetchone() is not None
-    if not exists:
+    # the duplicate check runs inside the INSERT, so this is one statement
+    with transaction(conn):
         conn.execute(
-            "INSERT OR IGNORE INTO one_time_expenses("  # avoid duplicates
-            "description, amount, created_at) VALUES(?,?,?)",
-            (desc, abs(amount), created_at.isoformat()),
+            _SQL_ADD_ONE_TIME,
+            (desc, amount, created_at.isoformat(), desc, amount, day),
         )
-        conn.commit()
+    conn.close()
+
+
+def add_one_time_expenses_bulk(
+    rows: Iterable[tuple[str, float, datetime]],
+) -> None:
+    """Store many non-recurring expenses in a single transaction.
+
+    Each row is ``(description, amount, date)``. As with
+    add_one_time_expense(), a row is skipped when an expense with the same
+    description and amount already exists on that day.
+    """
+    conn = get_connection()
+    # one read of the stored keys replaces a duplicate probe per row
+    seen = {
+        (r[0], r[1], r[2])
+        for r in conn.execute(
+            "SELECT description, amount, substr(created_at,1,10) "
+            "FROM one_time_expenses"
+        )
+    }
+    params = []
+    for desc, amount, created_at in rows:
+        amount = abs(amount)
+        day = created_at.date().isoformat()
+        key = (desc, amount, day)
+        if key in seen:
+            continue
+        seen.add(key)
+        params.append(
+            (desc, amount, created_at.isoformat(), desc, amount, day)
+        )
+    if params:
+        with transaction(conn):
+            conn.executemany(_SQL_ADD_ONE_TIME, params)
     conn.close()
 
 
@@ -747,29 +1102,27 @@ def delete_one_time_expenses(ids: Sequence[int]) -> None:
         return
     conn = get_connection()
     placeholders = ",".join("?" for _ in ids)
-    conn.execute(
-        f"DELETE FROM one_time_expenses WHERE id IN ({placeholders})", tuple(ids)
-    )
-    conn.commit()
+    with transaction(conn):
+        conn.execute(
+            f"DELETE FROM one_time_expenses WHERE id IN ({placeholders})",
+            tuple(ids),
+        )
     conn.close()
 
 
 def convert_one_time_to_monthly(oid: int) -> None:
     """Convert a one time expense to a recurring monthly expense."""
     conn = get_connection()
-    cur = conn.execute(
-        "SELECT description, amount FROM one_time_expenses WHERE id=?",
-        (oid,),
-    )
-    row = cur.fetchone()
+    with transaction(conn):
+        row = conn.execute(
+            "SELECT description, amount FROM one_time_expenses WHERE id=?",
+            (oid,),
+        ).fetchone()
+        if row:
+            conn.execute("DELETE FROM one_time_expenses WHERE id=?", (oid,))
+    conn.close()
     if row:
-        desc, amount = row["description"], row["amount"]
-        conn.execute("DELETE FROM one_time_expenses WHERE id=?", (oid,))
-        conn.commit()
-        conn.close()
-        add_monthly_expense(desc, amount)
-    else:
-        conn.close()
+        add_monthly_expense(row["description"], row["amount"])
 
 
 def set_subscription(username: str, tier: str) -> None:
@@ -781,14 +1134,14 @@ def set_subscription(username: str, tier: str) -> None:
     conn = get_connection()
     user_id = get_user_id(conn, username)
     now = datetime.utcnow().isoformat()
-    conn.execute(
-        (
-            "INSERT INTO subscriptions(user_id, tier, start_date) "
-            "VALUES(?,?,?) ON CONFLICT(user_id) DO UPDATE SET tier=excluded.tier"
-        ),
-        (user_id, tier, now),
-    )
-    conn.commit()
+    with transaction(conn):
+        conn.execute(
+            (
+                "INSERT INTO subscriptions(user_id, tier, start_date) "
+                "VALUES(?,?,?) ON CONFLICT(user_id) DO UPDATE SET tier=excluded.tier"  # noqa: E501
+            ),
+            (user_id, tier, now),
+        )
     conn.close()
 
 
@@ -836,11 +1189,11 @@ def record_transaction_sync(username: str) -> None:
     """Update the last_sync timestamp for a user."""
     conn = get_connection()
     user_id = get_user_id(conn, username)
-    conn.execute(
-        "UPDATE subscriptions SET last_sync=? WHERE user_id=?",
-        (datetime.utcnow().isoformat(), user_id),
-    )
-    conn.commit()
+    with transaction(conn):
+        conn.execute(
+            "UPDATE subscriptions SET last_sync=? WHERE user_id=?",
+            (datetime.utcnow().isoformat(), user_id),
+        )
     conn.close()
 
 
@@ -853,6 +1206,11 @@ def generate_transactions_from_plaid(username: str) -> None:
     record_transaction_sync(username)
 
 
+# months_to_payoff() gives up at this horizon
+_MAX_PAYOFF_MONTHS = 10000
+
+
+@lru_cache(maxsize=256)
 def months_to_payoff(
     balance: float,
     payment: float,
@@ -861,7 +1219,11 @@ def months_to_payoff(
     insurance: float = 0.0,
     tax: float = 0.0,
 ) -> int | None:
-    """Return estimated months to pay off a balance with interest."""
+    """Return estimated months to pay off a balance with interest.
+
+    Solves the amortization formula directly instead of stepping month by
+    month. Returns ``None`` when the payment never covers the interest.
+    """
     balance = abs(balance)
     principal_payment = payment - escrow - insurance - tax
     if principal_payment <= 0:
@@ -870,16 +1232,39 @@ def months_to_payoff(
         return int((balance + principal_payment - 1) // principal_payment)
 
     r = apr / 12 / 100
-    months = 0
-    prev = balance
-    while balance > 0 and months < 10000:
-        interest = balance * r
-        balance = balance + interest - principal_payment
+    ratio = r * balance / principal_payment
+    if ratio >= 1:
+        return None
+    months = math.ceil(-math.log1p(-ratio) / math.log1p(r))
+
+    def remaining(n: int) -> float:
+        growth = (1 + r) ** n
+        return balance * growth - principal_payment * (growth - 1) / r
+
+    # nudge across rounding error at exact month boundaries
+    if months > 0 and remaining(months - 1) <= 0:
+        months -= 1
+    elif remaining(months) > 0:
         months += 1
-        if balance >= prev:
-            return None
-        prev = balance
-    return months
+    return min(months, _MAX_PAYOFF_MONTHS)
+
+
+def payoff_and_next(
+    balance: float,
+    payment: float,
+    apr: float = 0.0,
+    escrow: float = 0.0,
+    insurance: float = 0.0,
+    tax: float = 0.0,
+) -> tuple[int | None, float]:
+    """Return ``(months_to_payoff, balance after one month)``.
+
+    Shorthand for the pair of calls the account listings make per row.
+    """
+    principal_payment = payment - escrow - insurance - tax
+    next_balance = balance * (1 + apr / 12 / 100) - principal_payment
+    months = months_to_payoff(balance, payment, apr, escrow, insurance, tax)
+    return months, next_balance
 
 
 def login_user(id_token: str) -> str | None:
@@ -904,11 +1289,11 @@ def login_user(id_token: str) -> str | None:
         username = row[0]
     else:
         username = phone
-        conn.execute(
-            "INSERT INTO users(username, auth_uid) VALUES(?, ?)",
-            (username, uid),
-        )
-        conn.commit()
+        with transaction(conn):
+            conn.execute(
+                "INSERT INTO users(username, auth_uid) VALUES(?, ?)",
+                (username, uid),
+            )
     conn.close()
     print(f"Logged in as {username}")
     return username
@@ -920,16 +1305,16 @@ def set_goal(category: str, amount: float, user: str = "default"):
     try:
         cat_id = get_category_id(conn, category)
         user_id = get_user_id(conn, user)
-        conn.execute(
-            (
-                "INSERT INTO goals(category_id, user_id, amount) "
-                "VALUES(?,?,?) "
-                "ON CONFLICT(category_id, user_id) DO UPDATE SET amount="
-                "excluded.amount"
-            ),
-            (cat_id, user_id, amount),
-        )
-        conn.commit()
+        with transaction(conn):
+            conn.execute(
+                (
+                    "INSERT INTO goals(category_id, user_id, amount) "
+                    "VALUES(?,?,?) "
+                    "ON CONFLICT(category_id, user_id) DO UPDATE SET amount="
+                    "excluded.amount"
+                ),
+                (cat_id, user_id, amount),
+            )
         print(f"Goal for {category} set to {fmt(amount)} for {user}.")
     except ValueError as e:
         print(e)
@@ -937,55 +1322,73 @@ def set_goal(category: str, amount: float, user: str = "default"):
         conn.close()
 
 
+_SQL_EXPORT = """
+    SELECT c.name, t.amount, t.type, t.description,
+        t.item_name, t.created_at
+    FROM transactions t
+    JOIN categories c ON t.category_id = c.id
+    WHERE t.user_id = ?
+    ORDER BY t.created_at ASC, t.id ASC
+"""
+# rows fetched per round trip while writing an export
+_EXPORT_BATCH = 1000
+
+
 def export_csv(output_file: str, user: str = "default"):
     """Export all transactions for the user to a CSV file."""
     conn = get_connection()
     user_id = get_user_id(conn, user)
-    cur = conn.execute(
-        """
-        SELECT c.name, t.amount, t.type, t.description,
-            t.item_name, t.created_at
-        FROM transactions t
-        JOIN categories c ON t.category_id = c.id
-        WHERE t.user_id = ?
-        ORDER BY t.created_at ASC
-        """,
-        (user_id,),
-    )
-    rows = cur.fetchall()
+    cur = conn.execute(_SQL_EXPORT, (user_id,))
+    count = 0
     with open(output_file, "w", newline="", encoding="utf-8") as f:
         writer = csv.writer(f)
         writer.writerow(
             ["category", "amount", "type", "description", "item_name", "created_at"]  # noqa: E501
         )
-        for r in rows:
-            writer.writerow(r)
-    print(f"Exported {len(rows)} transactions for {user} to {output_file}")
+        # stream from the cursor so large exports never sit in memory
+        while rows := cur.fetchmany(_EXPORT_BATCH):
+            writer.writerows(rows)
+            count += len(rows)
+    conn.close()
+    print(f"Exported {count} transactions for {user} to {output_file}")
+
+
+class _ListWriter:
+    """Minimal file-like object collecting ``csv.writer`` output chunks."""
+
+    def __init__(self):
+        self.parts: list[str] = []
+
+    def write(self, s: str) -> None:
+        self.parts.append(s)
+
+
+def iter_export_csv(user: str = "default") -> Iterator[str]:
+    """Yield the user's transactions as CSV text, one batch at a time.
+
+    Rows are read from the cursor in ``_EXPORT_BATCH`` chunks, so a large
+    history never has to be held in memory at once.
+    """
+    conn = get_connection()
+    try:
+        user_id = get_user_id(conn, user)
+        cur = conn.execute(_SQL_EXPORT, (user_id,))
+        output = _ListWriter()
+        writer = csv.writer(output)
+        writer.writerow(["category", "amount", "type", "description", "item_name", "created_at"])  # noqa: E501
+        while rows := cur.fetchmany(_EXPORT_BATCH):
+            writer.writerows(rows)
+            yield "".join(output.parts)
+            output.parts.clear()
+        if output.parts:
+            yield "".join(output.parts)
+    finally:
+        conn.close()
 
 
 def export_csv_string(user: str = "default") -> str:
     """Return all transactions for the user as CSV text."""
-    conn = get_connection()
-    user_id = get_user_id(conn, user)
-    cur = conn.execute(
-        """
-        SELECT c.name, t.amount, t.type, t.description,
-            t.item_name, t.created_at
-        FROM transactions t
-        JOIN categories c ON t.category_id = c.id
-        WHERE t.user_id = ?
-        ORDER BY t.created_at ASC
-        """,
-        (user_id,),
-    )
-    rows = cur.fetchall()
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["category", "amount", "type", "description", "item_name", "created_at"])  # noqa: E501
-    for r in rows:
-        writer.writerow(r)
-    conn.close()
-    return output.getvalue()
+    return "".join(iter_export_csv(user))
 
 
 def get_goal_status(user: str = "default") -> list[tuple[str, float, float]]:
@@ -994,17 +1397,21 @@ def get_goal_status(user: str = "default") -> list[tuple[str, float, float]]:
     user_id = get_user_id(conn, user)
     cur = conn.execute(
         """
-        SELECT c.name, g.amount,
-               (SELECT SUM(t.amount) FROM transactions t
-                WHERE t.category_id = c.id AND t.user_id=? AND t.type='expense') AS spent
+        SELECT c.name, g.amount, COALESCE(s.spent, 0.0)
         FROM goals g
         JOIN categories c ON g.category_id = c.id
+        LEFT JOIN (
+            SELECT category_id, SUM(amount) AS spent
+            FROM transactions
+            WHERE user_id=? AND type='expense'
+            GROUP BY category_id
+        ) s ON s.category_id = g.category_id
         WHERE g.user_id=?
         ORDER BY c.name
         """,
         (user_id, user_id),
     )
-    rows = [(r[0], r[1], r[2] or 0.0) for r in cur.fetchall()]
+    rows = [tuple(r) for r in cur.fetchall()]
     conn.close()
     return rows
 
@@ -1020,9 +1427,14 @@ def get_category_id(conn, name: str):
 
 def get_user_id(conn, username: str) -> int:
     """Return the user id for the given username."""
+    key = (_db_key(), username)
+    user_id = _USER_IDS.get(key)
+    if user_id is not None:
+        return user_id
     cur = conn.execute("SELECT id FROM users WHERE username=?", (username,))
     row = cur.fetchone()
     if row:
+        _USER_IDS[key] = row[0]
         return row[0]
     raise ValueError(f"User '{username}' not found")
 
@@ -1041,23 +1453,22 @@ def add_transaction(
     try:
         cat_id = get_category_id(conn, name)
         user_id = get_user_id(conn, user)
-        conn.execute(
-            (
-                "INSERT INTO transactions("
-                "category_id, user_id, amount, type, description, item_name, created_at) "  # noqa: E501
-                "VALUES(?,?,?,?,?,?,?)"
-            ),
-            (
-                cat_id,
-                user_id,
-                amount,
-                trans_type,
-                description,
-                item_name,
-                datetime.now().isoformat(),
-            ),
-        )
-        conn.commit()
+        with transaction(conn):
+            conn.execute(
+                (
+                    "INSERT INTO transactions("
+                    "category_id, user_id, amount, type, description, item_name, created_at) "  # noqa: E501
+                    f"VALUES(?,?,?,?,?,?,{_NOW_SQL})"
+                ),
+                (
+                    cat_id,
+                    user_id,
+                    amount,
+                    trans_type,
+                    description,
+                    item_name,
+                ),
+            )
         print(
             f"{trans_type.title()} of {fmt(amount)} added to {name} for {user}."  # noqa: E501
         )
@@ -1097,13 +1508,13 @@ def category_balance(name: str, user: str = "default"):
         cat_id = get_category_id(conn, name)
         user_id = get_user_id(conn, user)
         cur = conn.execute(
-            "SELECT type, SUM(amount) AS total FROM transactions "
-            "WHERE category_id=? AND user_id=? GROUP BY type",
+            "SELECT "
+            "COALESCE(SUM(CASE WHEN type='income' THEN amount END), 0), "
+            "COALESCE(SUM(CASE WHEN type='expense' THEN amount END), 0) "
+            "FROM transactions WHERE category_id=? AND user_id=?",
             (cat_id, user_id),
         )
-        totals = {row[0]: row[1] or 0 for row in cur.fetchall()}
-        income = totals.get("income", 0)
-        expense = totals.get("expense", 0)
+        income, expense = cur.fetchone()
         balance = income - expense
         print(
             (
@@ -1117,48 +1528,91 @@ def category_balance(name: str, user: str = "default"):
         conn.close()
 
 
+_ACCOUNT_LINE = "- {name} ({typ}): {future} ({sign}{change})".format
+
+
+def _future_balances(
+    accounts: Sequence[Account], net: float, months: int
+) -> list[float]:
+    """Return each account's projected balance after ``months``.
+
+    Bank accounts share the monthly net cash flow in proportion to their
+    balances (evenly if they are all empty); every other account follows
+    its payment schedule, projected in one forecast_balances() batch.
+    """
+    total_bank = 0.0
+    bank_count = 0
+    for r in accounts:
+        if r.type == "Bank":
+            total_bank += r.balance
+            bank_count += 1
+    net_times_months = net * months
+    inv_total_bank = 1.0 / total_bank if total_bank else 0.0
+    even_share = 1.0 / max(bank_count, 1)
+    # with no net cash flow bank balances simply carry forward
+    do_share = net != 0.0
+
+    others = [r for r in accounts if r.type != "Bank"]
+    projected = iter(
+        forecast_balances(
+            [r.balance for r in others],
+            [r.monthly_payment for r in others],
+            [r.apr for r in others],
+            [r.escrow for r in others],
+            [r.insurance for r in others],
+            [r.tax for r in others],
+            months,
+        )
+    )
+    futures = []
+    for row in accounts:
+        if row.type != "Bank":
+            futures.append(next(projected))
+        elif do_share:
+            share = row.balance * inv_total_bank if total_bank else even_share  # noqa: E501
+            futures.append(row.balance + net_times_months * share)
+        else:
+            futures.append(row.balance)
+    return futures
+
+
 def show_totals(user: str = "default", months: int = 1):
     """Print income, expenses, net and account forecasts."""
-    income, expense, net = calc_totals(user)
-    assets = total_asset_balance()
+    conn = get_connection()
+    try:
+        income, expense, net = calc_totals(user, conn)
+        assets = total_asset_balance(conn)
+        warn = months_until_bank_negative(user, conn)
+        accounts = get_all_accounts(conn)
+    finally:
+        conn.close()
     print(
         (
             f"Total Income: {fmt(income)}\nTotal Expense: {fmt(expense)}\n"
             f"Net Balance: {fmt(net)} ({user})\nTotal Assets: {fmt(assets)}"
         )
     )
-    warn = months_until_bank_negative(user)
     if warn is not None:
         print(f"Bank account will be negative in about {warn} months.")
 
-    accounts = get_all_accounts()
     if accounts:
         label = "month" if months == 1 else "months"
-        print(f"\nAccount forecast after {months} {label}:")
-
-        total_bank = sum(r["balance"] for r in accounts if r["type"] == "Bank")
-        bank_count = sum(1 for r in accounts if r["type"] == "Bank")
-
-        for row in accounts:
-            if row["type"] == "Bank":
-                share = row["balance"] / total_bank if total_bank else 1 / max(bank_count, 1)  # noqa: E501
-                future = row["balance"] + net * months * share
-            else:
-                future = account_balance_after_months(
-                    row["balance"],
-                    row["monthly_payment"],
-                    row["apr"],
-                    row["escrow"],
-                    row["insurance"],
-                    row["tax"],
-                    months,
+        lines = [f"\nAccount forecast after {months} {label}:"]
+
+        futures = _future_balances(accounts, net, months)
+        for row, future in zip(accounts, futures):
+            change = future - row.balance
+            lines.append(
+                _ACCOUNT_LINE(
+                    name=row.name,
+                    typ=row.type,
+                    future=fmt(future),
+                    sign="+" if change >= 0 else "-",
+                    change=fmt(abs(change)),
                 )
-            change = future - row["balance"]
-            sign = "+" if change >= 0 else "-"
-            print(
-                f"- {row['name']} ({row['type']}): {fmt(future)} "
-                f"({sign}{fmt(abs(change))})"
             )
+        lines.append("")
+        sys.stdout.write("\n".join(lines))
 
 
 def forecast_accounts(months: int = 1) -> None:
@@ -1171,44 +1625,32 @@ def forecast_accounts(months: int = 1) -> None:
     assets: list[str] = []
     debts: list[str] = []
 
-    total_bank = sum(r["balance"] for r in accounts if r["type"] == "Bank")
-    bank_count = sum(1 for r in accounts if r["type"] == "Bank")
     _, _, net = calc_totals()
-
-    for row in accounts:
-        if row["type"] == "Bank":
-            share = row["balance"] / total_bank if total_bank else 1 / max(bank_count, 1)  # noqa: E501
-            future = row["balance"] + net * months * share
-        else:
-            future = account_balance_after_months(
-                row["balance"],
-                row["monthly_payment"],
-                row["apr"],
-                row["escrow"],
-                row["insurance"],
-                row["tax"],
-                months,
-            )
-        change = future - row["balance"]
-        sign = "+" if change >= 0 else "-"
-        line = (
-            f"- {row['name']} ({row['type']}): {fmt(future)} "
-            f"({sign}{fmt(abs(change))})"
+    futures = _future_balances(accounts, net, months)
+    for row, future in zip(accounts, futures):
+        change = future - row.balance
+        line = _ACCOUNT_LINE(
+            name=row.name,
+            typ=row.type,
+            future=fmt(future),
+            sign="+" if change >= 0 else "-",
+            change=fmt(abs(change)),
         )
-        if row["type"] in ("Bank", "Crypto Wallet", "Stock Account"):
+        if row.type in ("Bank", "Crypto Wallet", "Stock Account"):
             assets.append(line)
         else:
             debts.append(line)
 
     label = "month" if months == 1 else "months"
+    out: list[str] = []
     if assets:
-        print(f"\nAccounts with funds after {months} {label}:")
-        for line in assets:
-            print(line)
+        out.append(f"\nAccounts with funds after {months} {label}:")
+        out.extend(assets)
     if debts:
-        print(f"\nAccounts with money owed after {months} {label}:")
-        for line in debts:
-            print(line)
+        out.append(f"\nAccounts with money owed after {months} {label}:")
+        out.extend(debts)
+    out.append("")
+    sys.stdout.write("\n".join(out))
 
 
 def list_categories():
@@ -1224,6 +1666,27 @@ def list_categories():
     conn.close()
 
 
+# kept at module level so the exact SQL text hits sqlite3's statement cache
+_SQL_HISTORY_ALL = """
+    SELECT c.name, t.amount, t.type, t.description,
+        t.item_name, t.created_at
+    FROM transactions t
+    JOIN categories c ON t.category_id = c.id
+    WHERE t.user_id = ?
+    ORDER BY t.created_at DESC, t.id DESC
+    LIMIT ?
+"""
+_SQL_HISTORY_CAT = """
+    SELECT c.name, t.amount, t.type, t.description,
+        t.item_name, t.created_at
+    FROM transactions t
+    JOIN categories c ON t.category_id = c.id
+    WHERE t.category_id = ? AND t.user_id = ?
+    ORDER BY t.created_at DESC, t.id DESC
+    LIMIT ?
+"""
+
+
 def list_transactions(category: str | None, limit: int, user: str = "default"):
     """Display recent transactions, optionally filtered by category."""
     conn = get_connection()
@@ -1232,38 +1695,19 @@ def list_transactions(category: str | None, limit: int, user: str = "default"):
         if category:
             cat_id = get_category_id(conn, category)
             cur = conn.execute(
-                """
-                SELECT c.name, t.amount, t.type, t.description,
-                    t.item_name, t.created_at
-        FROM transactions t
-                JOIN categories c ON t.category_id = c.id
-                WHERE t.category_id = ? AND t.user_id = ?
-                ORDER BY t.created_at DESC
-                LIMIT ?
-                """,
-                (cat_id, user_id, limit),
+                _SQL_HISTORY_CAT, (cat_id, user_id, limit)
             )
         else:
-            cur = conn.execute(
-                """
-                SELECT c.name, t.amount, t.type, t.description,
-                    t.item_name, t.created_at
-        FROM transactions t
-                JOIN categories c ON t.category_id = c.id
-                WHERE t.user_id = ?
-                ORDER BY t.created_at DESC
-                LIMIT ?
-                """,
-                (user_id, limit),
-            )
+            cur = conn.execute(_SQL_HISTORY_ALL, (user_id, limit))
         rows = cur.fetchall()
-        for row in rows:
-            desc = row[3] or ""
-            item = row[4] or ""
-            print(
-                f"{row[5]} | {row[0]} | {row[2]} | {fmt(row[1])} | {item} | {desc}"  # noqa: E501
-            )
-        if not rows:
+        if rows:
+            lines = [
+                f"{row[5]} | {row[0]} | {row[2]} | {fmt(row[1])} | {row[4] or ''} | {row[3] or ''}"  # noqa: E501
+                for row in rows
+            ]
+            lines.append("")
+            sys.stdout.write("\n".join(lines))
+        else:
             print("(no transactions)")
     except ValueError as e:
         print(e)
@@ -1271,7 +1715,7 @@ def list_transactions(category: str | None, limit: int, user: str = "default"):
         conn.close()
 
 
-def parse_args() -> argparse.Namespace:
+def parse_args(argv: Sequence[str] | None = None) -> argparse.Namespace:
     """Parse and return command line arguments."""
     parser = argparse.ArgumentParser(description="Budget Tool")
     parser.add_argument("--db", default=None, help="Path to database file")
@@ -1418,116 +1862,81 @@ def parse_args() -> argparse.Namespace:
     )
     parser_gen.add_argument("--user", default="default")
 
-    return parser.parse_args()
+    return parser.parse_args(argv)
+
+
+def _print_monthly(rows: list[tuple[str, float]]) -> None:
+    """Print recurring incomes or expenses as a bulleted list."""
+    for desc, amt in rows:
+        print(f"- {desc}: {fmt(amt)}")
+
+
+def _bank_balance_command(args: argparse.Namespace) -> None:
+    bal = bank_balance_after_months(args.months)
+    print(f"Estimated bank balance after {args.months} months: {fmt(bal)}")
+
+
+def _generate_transactions_command(args: argparse.Namespace) -> None:
+    try:
+        generate_transactions_from_plaid(args.user)
+    except RuntimeError as e:
+        print(e)
 
 
-def main() -> None:
+# map of CLI command name to handler; each handler receives parsed args
+DISPATCH = {
+    "init": lambda a: print(f"Database initialized at {DB_FILE}"),
+    "login": lambda a: login_user(a.token),
+    "add-user": lambda a: add_user(a.username),
+    "add-category": lambda a: add_category(a.name),
+    "delete-category": lambda a: delete_category(a.name),
+    "add-income": lambda a: add_transaction(
+        a.category, a.amount, "income", a.description, a.item, a.user
+    ),
+    "add-expense": lambda a: add_transaction(
+        a.category, a.amount, "expense", a.description, a.item, a.user
+    ),
+    "set-goal": lambda a: set_goal(a.category, a.amount, a.user),
+    "export-csv": lambda a: export_csv(a.output, a.user),
+    "balance": lambda a: category_balance(a.category, a.user),
+    "totals": lambda a: show_totals(a.user, a.months),
+    "list": lambda a: list_categories(),
+    "history": lambda a: list_transactions(a.category, a.limit, a.user),
+    "add-monthly-income": lambda a: add_monthly_income(
+        a.description, a.amount, a.category, a.user
+    ),
+    "list-monthly-incomes": lambda a: _print_monthly(get_monthly_incomes()),
+    "delete-monthly-income": lambda a: delete_monthly_income(a.description),
+    "add-monthly-expense": lambda a: add_monthly_expense(
+        a.description, a.amount, a.category
+    ),
+    "list-monthly-expenses": lambda a: _print_monthly(get_monthly_expenses()),
+    "delete-monthly-expense": lambda a: delete_monthly_expense(a.description),
+    "set-account": lambda a: set_account(
+        a.name, a.balance, a.payment, a.type, a.apr, a.escrow, a.insurance,
+        a.tax,
+    ),
+    "list-accounts": lambda a: list_accounts(),
+    "forecast": lambda a: forecast_accounts(a.months),
+    "bank-balance": _bank_balance_command,
+    "delete-account": lambda a: delete_account(a.name),
+    "set-subscription": lambda a: set_subscription(a.user, a.tier),
+    "generate-transactions": _generate_transactions_command,
+}
+
+
+def main(argv: Sequence[str] | None = None) -> None:
     """Entry point for the command line interface."""
     global DB_FILE
-    args = parse_args()
+    args = parse_args(argv)
     if args.db:
         DB_FILE = Path(args.db)
-    if args.command == "init":
-        init_db()
-        print(f"Database initialized at {DB_FILE}")
-    elif args.command == "login":
-        init_db()
-        login_user(args.token)
-    elif args.command == "add-user":
-        init_db()
-        add_user(args.username)
-    elif args.command == "add-category":
-        init_db()
-        add_category(args.name)
-    elif args.command == "delete-category":
-        init_db()
-        delete_category(args.name)
-    elif args.command == "add-income":
-        init_db()
-        add_transaction(
-            args.category, args.amount, "income", args.description, args.item, args.user  # noqa: E501
-        )
-    elif args.command == "add-expense":
-        init_db()
-        add_transaction(
-            args.category, args.amount, "expense", args.description, args.item, args.user  # noqa: E501
-        )
-    elif args.command == "set-goal":
-        init_db()
-        set_goal(args.category, args.amount, args.user)
-    elif args.command == "export-csv":
-        init_db()
-        export_csv(args.output, args.user)
-    elif args.command == "balance":
-        init_db()
-        category_balance(args.category, args.user)
-    elif args.command == "totals":
-        init_db()
-        show_totals(args.user, args.months)
-    elif args.command == "list":
-        init_db()
-        list_categories()
-    elif args.command == "history":
-        init_db()
-        list_transactions(args.category, args.limit, args.user)
-    elif args.command == "add-monthly-income":
-        init_db()
-        add_monthly_income(args.description, args.amount, args.category, args.user)
-    elif args.command == "list-monthly-incomes":
-        init_db()
-        for desc, amt in get_monthly_incomes():
-            print(f"- {desc}: {fmt(amt)}")
-    elif args.command == "delete-monthly-income":
-        init_db()
-        delete_monthly_income(args.description)
-    elif args.command == "add-monthly-expense":
-        init_db()
-        add_monthly_expense(args.description, args.amount, args.category)
-    elif args.command == "list-monthly-expenses":
-        init_db()
-        for desc, amt in get_monthly_expenses():
-            print(f"- {desc}: {fmt(amt)}")
-    elif args.command == "delete-monthly-expense":
-        init_db()
-        delete_monthly_expense(args.description)
-    elif args.command == "set-account":
-        init_db()
-        set_account(
-            args.name,
-            args.balance,
-            args.payment,
-            args.type,
-            args.apr,
-            args.escrow,
-            args.insurance,
-            args.tax,
-        )
-    elif args.command == "list-accounts":
-        init_db()
-        list_accounts()
-    elif args.command == "forecast":
-        init_db()
-        forecast_accounts(args.months)
-    elif args.command == "bank-balance":
-        init_db()
-        bal = bank_balance_after_months(args.months)
-        print(
-            f"Estimated bank balance after {args.months} months: {fmt(bal)}"
-        )
-    elif args.command == "delete-account":
-        init_db()
-        delete_account(args.name)
-    elif args.command == "set-subscription":
-        init_db()
-        set_subscription(args.user, args.tier)
-    elif args.command == "generate-transactions":
-        init_db()
-        try:
-            generate_transactions_from_plaid(args.user)
-        except RuntimeError as e:
-            print(e)
-    else:
+    handler = DISPATCH.get(args.command)
+    if handler is None:
         print("No command provided. Use -h for help.")
+        return
+    init_db()
+    handler(args)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,79 @@
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import budget_tool  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def schema_db(tmp_path_factory):
+    """Empty database with the full schema, built once per session."""
+    path = tmp_path_factory.mktemp("schema") / "budget.db"
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(budget_tool, "DB_FILE", path)
+        budget_tool.init_db()
+        budget_tool.close_connection()
+    return path
+
+
+@pytest.fixture
+def fresh_db(schema_db, tmp_path, monkeypatch):
+    """Point budget_tool at a private copy of the schema database."""
+    path = tmp_path / "budget.db"
+    shutil.copyfile(schema_db, path)
+    monkeypatch.setattr(budget_tool, "DB_FILE", path)
+    yield path
+    budget_tool.close_connection()
+
+
+@pytest.fixture
+def seed():
+    """Return a helper that inserts test rows over one connection.
+
+    ``transactions`` are ``(category, amount, type, description)`` tuples.
+    ``monthly_expenses`` are ``(description, amount, category)`` tuples and,
+    like add_monthly_expense(), also record a matching expense transaction.
+    ``accounts`` are ``(name, balance, payment, type)`` tuples. Categories
+    referenced by any row are created as needed.
+    """
+
+    def seed(
+        categories=(), transactions=(), monthly_expenses=(), accounts=()
+    ):
+        transactions = [*transactions] + [
+            (cat, amt, "expense", desc) for desc, amt, cat in monthly_expenses
+        ]
+        names = dict.fromkeys([*categories, *(t[0] for t in transactions)])
+        conn = budget_tool.get_connection()
+        with budget_tool.transaction(conn):
+            conn.executemany(
+                "INSERT OR IGNORE INTO categories(name) VALUES(?)",
+                [(n,) for n in names],
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO monthly_expenses(description, amount) "
+                "VALUES(?,?)",
+                [(desc, abs(amt)) for desc, amt, _ in monthly_expenses],
+            )
+            conn.executemany(
+                "INSERT INTO transactions("
+                "category_id, user_id, amount, type, description) "
+                "SELECT c.id, u.id, ?, ?, ? FROM categories c, users u "
+                "WHERE c.name=? AND u.username='default'",
+                [
+                    (abs(amt), typ, desc, cat)
+                    for cat, amt, typ, desc in transactions
+                ],
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO accounts("
+                "name, balance, monthly_payment, type) VALUES(?,?,?,?)",
+                accounts,
+            )
+        conn.close()
+
+    return seed
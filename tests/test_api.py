@@ -1,5 +1,8 @@
 import sys
 from pathlib import Path
+
+import pytest
+
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
 import budget_tool
@@ -7,29 +10,26 @@ import webapp
 import api
 
 
-def setup_client(tmp_path, monkeypatch):
-    budget_tool.DB_FILE = tmp_path / "budget.db"
+@pytest.fixture
+def client(fresh_db, monkeypatch):
     webapp.setup_db()
     monkeypatch.setattr(budget_tool, "login_user", lambda t: "tester")
     budget_tool.add_user("tester")
-    client = webapp.app.test_client()
-    return client
+    return webapp.app.test_client()
 
 
 def auth_hdr():
     return {"Authorization": "Bearer x"}
 
 
-def test_categories_api(tmp_path, monkeypatch):
-    client = setup_client(tmp_path, monkeypatch)
+def test_categories_api(client):
     resp = client.post("/api/categories", json={"name": "Food"}, headers=auth_hdr())
     assert resp.status_code == 201
     resp = client.get("/api/categories", headers=auth_hdr())
     assert resp.get_json() == ["Food"]
 
 
-def test_accounts_api(tmp_path, monkeypatch):
-    client = setup_client(tmp_path, monkeypatch)
+def test_accounts_api(client):
     resp = client.post(
         "/api/accounts",
         json={"name": "Bank", "balance": 100, "payment": 0, "type": "Bank"},
@@ -41,8 +41,7 @@ def test_accounts_api(tmp_path, monkeypatch):
     assert data and data[0]["name"] == "Bank"
 
 
-def test_transactions_api(tmp_path, monkeypatch):
-    client = setup_client(tmp_path, monkeypatch)
+def test_transactions_api(client):
     client.post("/api/categories", json={"name": "Misc"}, headers=auth_hdr())
     resp = client.post(
         "/api/transactions",
@@ -55,8 +54,7 @@ def test_transactions_api(tmp_path, monkeypatch):
     assert data and data[0]["amount"] == 5
 
 
-def test_goals_api(tmp_path, monkeypatch):
-    client = setup_client(tmp_path, monkeypatch)
+def test_goals_api(client):
     client.post("/api/categories", json={"name": "Food"}, headers=auth_hdr())
     resp = client.post(
         "/api/goals",
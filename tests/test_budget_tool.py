@@ -1,158 +1,275 @@
+import contextlib
+import io
+import os
+import shutil
 import sqlite3
 import subprocess
+import sys
+from functools import cached_property
 from pathlib import Path
 from datetime import datetime
+from types import SimpleNamespace
 
+import pytest
 
 SCRIPT = Path(__file__).resolve().parents[1] / "budget_tool.py"
+sys.path.insert(0, str(SCRIPT.parent))
+
+import budget_tool  # noqa: E402
+from budget_tool import (  # noqa: E402
+    TransactionRecord,
+    find_recurring_expenses,
+    months_to_payoff,
+    parse_statement_csv,
+)
+
+
+@pytest.fixture(autouse=True)
+def _reset_bt(monkeypatch, tmp_path):
+    # point every test at its own database; main() may rebind DB_FILE too
+    monkeypatch.setattr(budget_tool, "DB_FILE", tmp_path / "budget.db")
+    budget_tool.close_connection()
+    yield
+    budget_tool.close_connection()
+
+
+TEMPLATE_CATEGORIES = [
+    "Food", "Job", "Salary", "Misc", "Groceries", "Utilities",
+]
+
+
+@pytest.fixture(scope="session")
+def template_db(schema_db, tmp_path_factory):
+    """Initialized database holding TEMPLATE_CATEGORIES, built once."""
+    path = tmp_path_factory.mktemp("template") / "budget.db"
+    shutil.copyfile(schema_db, path)
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(budget_tool, "DB_FILE", path)
+        budget_tool.init_db()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for name in TEMPLATE_CATEGORIES:
+                budget_tool.add_category(name)
+        budget_tool.close_connection()
+    return path
+
+
+@pytest.fixture
+def bt(template_db):
+    """Copy the template database into place and return budget_tool."""
+    shutil.copyfile(template_db, budget_tool.DB_FILE)
+    budget_tool.init_db()
+    yield budget_tool
+
+
+@pytest.fixture
+def conn(bt):
+    """Return the cached connection to the ``bt`` database."""
+    yield bt.get_connection()
+    bt.close_connection()
+
+
+def assert_contains(text, *needles):
+    """Assert that every needle occurs in text, reporting all misses."""
+    missing = [n for n in needles if n not in text]
+    assert not missing, f"missing {missing!r} in:\n{text}"
+
+
+def run_cli(tmp_path, *args, db_path=None, capture=True):
+    """Run the CLI in-process; output is discarded unless ``capture``."""
+    argv = ["--db", str(db_path or tmp_path / "budget.db"), *args]
+    code = 0
+    with contextlib.ExitStack() as stack:
+        if capture:
+            out = io.StringIO()
+            err = io.StringIO()
+        else:
+            out = err = stack.enter_context(open(os.devnull, "w"))
+        stack.enter_context(contextlib.redirect_stdout(out))
+        stack.enter_context(contextlib.redirect_stderr(err))
+        try:
+            budget_tool.main(argv)
+        except SystemExit as exc:
+            code = exc.code
+    if not capture:
+        return SimpleNamespace(stdout="", stderr="", returncode=code)
+    return SimpleNamespace(
+        stdout=out.getvalue(), stderr=err.getvalue(), returncode=code
+    )
+
+
+class _ScriptResult:
+    """Subprocess result whose output is decoded on first access."""
+
+    def __init__(self, proc):
+        self._proc = proc
+        self.returncode = proc.returncode
 
+    @cached_property
+    def stdout(self):
+        return self._proc.stdout.decode("utf-8", "replace")
 
-def run_cli(tmp_path, *args, db_path=None):
-    script_copy = tmp_path / "budget_tool.py"
-    script_copy.write_bytes(SCRIPT.read_bytes())
-    cmd = ["python3", str(script_copy)]
-    if db_path:
-        cmd += ["--db", str(db_path)]
+    @cached_property
+    def stderr(self):
+        return self._proc.stderr.decode("utf-8", "replace")
+
+
+def run_script(tmp_path, *args, capture=True):
+    """Run budget_tool.py in a subprocess against tmp_path's database."""
+    cmd = ["python3", str(SCRIPT), "--db", str(tmp_path / "budget.db")]
     cmd.extend(args)
-    result = subprocess.run(
-        cmd,
-        cwd=tmp_path,
-        text=True,
-        capture_output=True,
-    )
-    return result
+    if not capture:
+        return subprocess.run(
+            cmd,
+            cwd=tmp_path,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+    result = subprocess.run(cmd, cwd=tmp_path, capture_output=True)
+    return _ScriptResult(result)
 
 
 def test_init_creates_db(tmp_path):
-    result = run_cli(tmp_path, "init")
+    # end-to-end check that the script runs standalone
+    result = run_script(tmp_path, "init")
     assert (tmp_path / "budget.db").exists()
     assert "Database initialized" in result.stdout
 
 
 def test_add_category_and_duplicate(tmp_path):
-    run_cli(tmp_path, "init")
+    run_cli(tmp_path, "init", capture=False)
     out1 = run_cli(tmp_path, "add-category", "Food").stdout
     assert "Category 'Food' added" in out1
     out2 = run_cli(tmp_path, "add-category", "Food").stdout
     assert "already exists" in out2
-    conn = sqlite3.connect(tmp_path / "budget.db")
+    conn = budget_tool.get_connection()
     count = conn.execute("SELECT count(*) FROM categories").fetchone()[0]
     conn.close()
     assert count == 1
 
 
-def test_income_expense_balance(tmp_path):
-    run_cli(tmp_path, "init")
-    run_cli(tmp_path, "add-category", "Salary")
-    run_cli(tmp_path, "add-income", "Salary", "1000")
-    run_cli(tmp_path, "add-expense", "Salary", "200")
+def test_income_expense_balance(tmp_path, bt):
+    bt.add_transaction("Salary", 1000, "income")
+    bt.add_transaction("Salary", 200, "expense")
     bal = run_cli(tmp_path, "balance", "Salary").stdout
-    assert "Income: 1,000.00" in bal
-    assert "Expense: 200.00" in bal
-    assert "Balance: 800.00" in bal
+    assert_contains(
+        bal,
+        "Income: 1,000.00",
+        "Expense: 200.00",
+        "Balance: 800.00",
+    )
 
 
-def test_totals_output(tmp_path):
-    run_cli(tmp_path, "init")
-    run_cli(tmp_path, "add-category", "Job")
-    run_cli(tmp_path, "add-category", "Groceries")
-    run_cli(tmp_path, "add-income", "Job", "1500")
-    run_cli(tmp_path, "add-expense", "Groceries", "500")
+def test_totals_output(tmp_path, bt):
+    bt.add_transaction("Job", 1500, "income")
+    bt.add_transaction("Groceries", 500, "expense")
     totals = run_cli(tmp_path, "totals").stdout
-    assert "Total Income: 1,500.00" in totals
-    assert "Total Expense: 500.00" in totals
-    assert "Net Balance: 1,000.00" in totals
-    assert "Total Assets: 0.00" in totals
+    assert_contains(
+        totals,
+        "Total Income: 1,500.00",
+        "Total Expense: 500.00",
+        "Net Balance: 1,000.00",
+        "Total Assets: 0.00",
+    )
 
 
-def test_goal_warning(tmp_path):
-    run_cli(tmp_path, "init")
-    run_cli(tmp_path, "add-category", "Food")
-    run_cli(tmp_path, "set-goal", "Food", "50")
+def test_goal_warning(tmp_path, bt):
+    bt.set_goal("Food", 50)
     warn = run_cli(tmp_path, "add-expense", "Food", "60").stdout
     assert "Warning" in warn
 
 
-def test_export_csv(tmp_path):
-    run_cli(tmp_path, "init")
-    run_cli(tmp_path, "add-category", "Job")
-    run_cli(tmp_path, "add-income", "Job", "100")
+def test_export_csv(tmp_path, bt):
+    bt.add_transaction("Job", 100, "income")
     out = tmp_path / "data.csv"
-    run_cli(tmp_path, "export-csv", "--output", str(out))
-    assert out.exists()
-    lines = out.read_text().splitlines()
-    assert lines[0].startswith("category")
-    assert len(lines) == 2
+    run_cli(tmp_path, "export-csv", "--output", str(out), capture=False)
+    with out.open() as fh:
+        header = next(fh)
+        rows = sum(1 for _ in fh)
+    assert header.startswith("category")
+    assert rows == 1
+
+
+def test_export_csv_many_rows(tmp_path, bt, conn):
+    cat_id = bt.get_category_id(conn, "Job")
+    user_id = bt.get_user_id(conn, "default")
+    conn.executemany(
+        "INSERT INTO transactions(category_id, user_id, amount, type) "
+        "VALUES(?,?,?,'income')",
+        [(cat_id, user_id, i) for i in range(10_500)],
+    )
+    conn.commit()
+    out = tmp_path / "data.csv"
+    result = run_cli(tmp_path, "export-csv", "--output", str(out))
+    assert "Exported 10500 transactions" in result.stdout
+    with out.open() as fh:
+        next(fh)
+        assert sum(1 for _ in fh) == 10_500
 
 
-def test_history_output(tmp_path):
-    run_cli(tmp_path, "init")
-    run_cli(tmp_path, "add-category", "Misc")
-    run_cli(tmp_path, "add-expense", "Misc", "5", "-d", "snack")
+def test_history_output(tmp_path, bt):
+    bt.add_transaction("Misc", 5, "expense", description="snack")
     hist = run_cli(tmp_path, "history").stdout
     assert "snack" in hist
 
 
-def test_item_name_recorded(tmp_path):
-    run_cli(tmp_path, "init")
-    run_cli(tmp_path, "add-category", "Utilities")
-    run_cli(tmp_path, "add-expense", "Utilities", "30", "--item", "Water")
+def test_item_name_recorded(tmp_path, bt):
+    bt.add_transaction("Utilities", 30, "expense", item_name="Water")
     hist = run_cli(tmp_path, "history").stdout
     assert "Water" in hist
 
 
 def test_custom_db_path(tmp_path):
     custom = tmp_path / "custom.db"
-    run_cli(tmp_path, "init", db_path=custom)
+    run_cli(tmp_path, "init", db_path=custom, capture=False)
     assert custom.exists()
 
 
-def test_delete_account(tmp_path):
-    run_cli(tmp_path, "init")
-    run_cli(tmp_path, "set-account", "Bank", "50")
+def test_delete_account(tmp_path, bt):
+    bt.set_account("Bank", 50)
     before = run_cli(tmp_path, "list-accounts").stdout
     assert "Bank" in before
-    run_cli(tmp_path, "delete-account", "Bank")
+    run_cli(tmp_path, "delete-account", "Bank", capture=False)
     after = run_cli(tmp_path, "list-accounts").stdout
     assert "Bank" not in after
 
 
-def test_bank_balance_projection(tmp_path):
-    run_cli(tmp_path, "init")
-    run_cli(tmp_path, "add-category", "Job")
-    run_cli(tmp_path, "add-income", "Job", "100")
-    import budget_tool
-    budget_tool.DB_FILE = tmp_path / "budget.db"
-    budget_tool.set_account("Bank", 1000, acct_type="Bank")
+def test_bank_balance_projection(tmp_path, bt):
+    bt.add_transaction("Job", 100, "income")
+    bt.set_account("Bank", 1000, acct_type="Bank")
     out = run_cli(tmp_path, "bank-balance", "3").stdout
     assert "1,300.00" in out
 
 
-def test_totals_negative_warning(tmp_path):
-    run_cli(tmp_path, "init")
-    run_cli(tmp_path, "add-category", "Job")
-    run_cli(tmp_path, "add-income", "Job", "100")
-    run_cli(tmp_path, "add-category", "Food")
-    run_cli(tmp_path, "add-expense", "Food", "150")
-    import budget_tool
-    budget_tool.DB_FILE = tmp_path / "budget.db"
-    budget_tool.set_account("Bank", 200, acct_type="Bank")
+def test_totals_negative_warning(tmp_path, bt):
+    bt.add_transaction("Job", 100, "income")
+    bt.add_transaction("Food", 150, "expense")
+    bt.set_account("Bank", 200, acct_type="Bank")
     out = run_cli(tmp_path, "totals").stdout
-    assert "Net Balance: -50.00" in out
-    assert "negative in about 4 months" in out
-    assert "Total Assets: 200.00" in out
-
+    assert_contains(
+        out,
+        "Net Balance: -50.00",
+        "negative in about 4 months",
+        "Total Assets: 200.00",
+    )
 
-def test_months_to_payoff_interest(tmp_path):
-    run_cli(tmp_path, "init")
-    from budget_tool import months_to_payoff
 
+def test_months_to_payoff_interest():
     assert months_to_payoff(1000, 100, 0) == 10
     assert months_to_payoff(1000, 100, 20) > 10
 
 
+def test_months_to_payoff_closed_form_edges():
+    assert months_to_payoff(1000, 100, 20) == 12
+    assert months_to_payoff(1000, 10.0000001, 12) == 1852
+    # payment that only covers the interest never pays the balance off
+    assert months_to_payoff(1200, 12, 12) is None
+    assert months_to_payoff(1200, 10, 12) is None
+    assert months_to_payoff(0, 100, 12) == 0
+    assert months_to_payoff(1_000_000, 100.01, 0.12) == 10000
+
+
 def test_set_account_with_apr_cli(tmp_path):
-    run_cli(tmp_path, "init")
+    run_cli(tmp_path, "init", capture=False)
     run_cli(
         tmp_path,
         "set-account",
@@ -162,6 +279,7 @@ def test_set_account_with_apr_cli(tmp_path):
         "50",
         "--apr",
         "10",
+        capture=False,
     )
     out = run_cli(tmp_path, "list-accounts").stdout
     assert "Card" in out
@@ -173,38 +291,37 @@ def test_set_account_with_apr_cli(tmp_path):
     assert months and months > 100
 
 
-def test_totals_forecast(tmp_path):
-    run_cli(tmp_path, "init")
-    run_cli(tmp_path, "add-category", "Job")
-    run_cli(tmp_path, "add-income", "Job", "1000")
-    import budget_tool
-    budget_tool.DB_FILE = tmp_path / "budget.db"
-    budget_tool.set_account("Card", 1000, payment=100, apr=12, acct_type="Credit Card")
+def test_totals_forecast(tmp_path, bt):
+    bt.add_transaction("Job", 1000, "income")
+    bt.set_account(
+        "Card", 1000, payment=100, apr=12, acct_type="Credit Card"
+    )
     out = run_cli(tmp_path, "totals", "--months", "1").stdout
-    assert "Account forecast after 1 month" in out
-    assert "Card" in out
-    assert "910.00" in out
+    assert_contains(
+        out,
+        "Account forecast after 1 month",
+        "Card",
+        "910.00",
+    )
 
 
-def test_forecast_command(tmp_path):
-    run_cli(tmp_path, "init")
-    import budget_tool
-    budget_tool.DB_FILE = tmp_path / "budget.db"
-    budget_tool.set_account("Bank", 1000, acct_type="Bank")
-    budget_tool.set_account("Card", 500, payment=50, acct_type="Credit Card")
+def test_forecast_command(tmp_path, bt):
+    bt.set_account("Bank", 1000, acct_type="Bank")
+    bt.set_account("Card", 500, payment=50, acct_type="Credit Card")
     out = run_cli(tmp_path, "forecast", "--months", "2").stdout
-    assert "Accounts with funds after 2 months" in out
-    assert "Accounts with money owed after 2 months" in out
-    assert "Bank" in out
-    assert "Card" in out
+    assert_contains(
+        out,
+        "Accounts with funds after 2 months",
+        "Accounts with money owed after 2 months",
+        "Bank",
+        "Card",
+    )
 
 
 def test_parse_statement_csv(tmp_path):
     csv_text = "date,description,amount\n2023-01-01,Gym,10\n2023-01-02,Netflix,15"
     f = tmp_path / "s.csv"
     f.write_text(csv_text)
-    from budget_tool import parse_statement_csv
-
     records = parse_statement_csv(f)
     assert len(records) == 2
     assert records[0].description == "Gym"
@@ -212,63 +329,49 @@ def test_parse_statement_csv(tmp_path):
     assert records[0].category is None
 
 
-def test_parse_statement_csv_posting_date(tmp_path):
-    csv_text = "Posting Date,Description,Amount,Transaction Category\n" \
-        "2023-01-01,Coffee,5,Drinks"
-    f = tmp_path / "s2.csv"
-    f.write_text(csv_text)
-    from budget_tool import parse_statement_csv
-
-    records = parse_statement_csv(f)
-    assert len(records) == 1
-    assert records[0].description == "Coffee"
-    assert records[0].amount == 5
-    assert records[0].date == datetime(2023, 1, 1)
-    assert records[0].category == "Drinks"
-
-
-def test_parse_statement_csv_tab_delimited(tmp_path):
-    csv_text = "date\tdescription\tamount\n2023-01-01\tGym\t10"
-    f = tmp_path / "tab.tsv"
-    f.write_text(csv_text)
-    from budget_tool import parse_statement_csv
-
-    records = parse_statement_csv(f)
-    assert len(records) == 1
-    assert records[0].description == "Gym"
-    assert records[0].amount == 10
-
-
-def test_parse_statement_csv_date_formats(tmp_path):
-    csv_text = (
-        "date,description,amount\n20230102,Gym,20\n01/03/2023,Store,5"
-    )
-    f = tmp_path / "dates.csv"
-    f.write_text(csv_text)
-    from budget_tool import parse_statement_csv
-
-    records = parse_statement_csv(f)
-    assert len(records) == 2
-    assert records[0].date == datetime(2023, 1, 2)
-    assert records[1].date == datetime(2023, 1, 3)
-
-
-def test_parse_statement_csv_category_detection(tmp_path):
-    csv_text = (
-        "date,description,amount,category\n"
-        "2023-01-01,Gym,10,Health"
-    )
-    f = tmp_path / "cat.csv"
-    f.write_text(csv_text)
-    from budget_tool import parse_statement_csv
-
-    records = parse_statement_csv(f)
-    assert len(records) == 1
-    assert records[0].category == "Health"
+@pytest.mark.parametrize(
+    "csv_text,expected",
+    [
+        pytest.param(
+            "Posting Date,Description,Amount,Transaction Category\n"
+            "2023-01-01,Coffee,5,Drinks",
+            [TransactionRecord(datetime(2023, 1, 1), "Coffee", 5, "Drinks")],
+            id="posting-date",
+        ),
+        pytest.param(
+            "date\tdescription\tamount\n2023-01-01\tGym\t10",
+            [TransactionRecord(datetime(2023, 1, 1), "Gym", 10)],
+            id="tab-delimited",
+        ),
+        pytest.param(
+            "date,description,amount\n20230102,Gym,20\n01/03/2023,Store,5",
+            [
+                TransactionRecord(datetime(2023, 1, 2), "Gym", 20),
+                TransactionRecord(datetime(2023, 1, 3), "Store", 5),
+            ],
+            id="date-formats",
+        ),
+        pytest.param(
+            "date,description,amount,category\n2023-01-01,Gym,10,Health",
+            [TransactionRecord(datetime(2023, 1, 1), "Gym", 10, "Health")],
+            id="category-detection",
+        ),
+        pytest.param(
+            "2023-01-01,Gym,10\n2023-02-01,Gym,12",
+            [
+                TransactionRecord(datetime(2023, 1, 1), "Gym", 10),
+                TransactionRecord(datetime(2023, 2, 1), "Gym", 12),
+            ],
+            id="no-header",
+        ),
+        pytest.param("", [], id="empty"),
+    ],
+)
+def test_parse_statement_csv_formats(csv_text, expected):
+    assert parse_statement_csv(io.StringIO(csv_text)) == expected
 
 
 def test_find_recurring_expenses():
-    from budget_tool import TransactionRecord, find_recurring_expenses
     rec1 = [
         TransactionRecord(datetime(2023, 1, 1), "Gym", 10),
         TransactionRecord(datetime(2023, 1, 2), "Store", 5),
@@ -284,8 +387,6 @@ def test_find_recurring_expenses():
 
 def test_find_recurring_expenses_day_window():
     """Charges on adjacent days should match within the window."""
-    from budget_tool import TransactionRecord, find_recurring_expenses
-
     jan = [TransactionRecord(datetime(2023, 1, 20), "Service", 30)]
     feb = [TransactionRecord(datetime(2023, 2, 21), "Service", 29.9)]
 
@@ -295,8 +396,6 @@ def test_find_recurring_expenses_day_window():
 
 def test_find_recurring_expenses_positive_amount():
     """Negative amounts should be returned as positive values."""
-    from budget_tool import TransactionRecord, find_recurring_expenses
-
     jan = [TransactionRecord(datetime(2023, 1, 1), "Gym", -10)]
     feb = [TransactionRecord(datetime(2023, 2, 1), "Gym", -10)]
 
@@ -304,32 +403,19 @@ def test_find_recurring_expenses_positive_amount():
     assert res and res[0][1] == 10
 
 
-def test_add_monthly_expense_abs(tmp_path):
-    import budget_tool
+def test_add_monthly_expense_abs(bt, conn):
+    bt.add_monthly_expense("Gym", -20)
 
-    budget_tool.DB_FILE = tmp_path / "budget.db"
-    budget_tool.init_db()
-    budget_tool.add_category("Misc")
-    budget_tool.add_monthly_expense("Gym", -20)
-
-    conn = budget_tool.get_connection()
     amt = conn.execute(
         "SELECT amount FROM monthly_expenses WHERE description=?",
         ("Gym",),
     ).fetchone()[0]
-    conn.close()
     assert amt == 20
 
 
-def test_monthly_income_functions(tmp_path):
-    import budget_tool
+def test_monthly_income_functions(bt, conn):
+    bt.add_monthly_income("Salary", 100, "Job")
 
-    budget_tool.DB_FILE = tmp_path / "budget.db"
-    budget_tool.init_db()
-    budget_tool.add_category("Job")
-    budget_tool.add_monthly_income("Salary", 100, "Job")
-
-    conn = budget_tool.get_connection()
     cur = conn.execute(
         "SELECT count(*) FROM monthly_incomes WHERE description=?",
         ("Salary",),
@@ -340,23 +426,19 @@ def test_monthly_income_functions(tmp_path):
         ("Salary",),
     )
     assert cur.fetchone()[0] == 1
-    conn.close()
 
 
 def test_monthly_expense_cli(tmp_path):
-    run_cli(tmp_path, "init")
-    run_cli(tmp_path, "add-monthly-expense", "Gym", "20")
+    run_cli(tmp_path, "init", capture=False)
+    run_cli(tmp_path, "add-monthly-expense", "Gym", "20", capture=False)
     out = run_cli(tmp_path, "list-monthly-expenses").stdout
     assert "Gym" in out
-    run_cli(tmp_path, "delete-monthly-expense", "Gym")
+    run_cli(tmp_path, "delete-monthly-expense", "Gym", capture=False)
     out2 = run_cli(tmp_path, "list-monthly-expenses").stdout
     assert "Gym" not in out2
 
 
-def test_one_time_expense_functions(tmp_path):
-    import budget_tool
-
-    budget_tool.DB_FILE = tmp_path / "budget.db"
+def test_one_time_expense_functions():
     budget_tool.init_db()
     dt = datetime(2023, 1, 1)
     budget_tool.add_one_time_expense("Laptop", 1000, dt)
@@ -367,3 +449,135 @@ def test_one_time_expense_functions(tmp_path):
     budget_tool.convert_one_time_to_monthly(oid)
     assert budget_tool.monthly_expense_exists("Laptop")
     assert budget_tool.get_one_time_expenses() == []
+
+
+def test_one_time_expenses_bulk_skips_duplicates(bt):
+    bt.add_one_time_expense("Laptop", 1000, datetime(2023, 1, 1))
+    bt.add_one_time_expenses_bulk(
+        [
+            ("Laptop", -1000, datetime(2023, 1, 1, 12)),
+            ("Coffee", -5, datetime(2023, 1, 2)),
+            ("Coffee", -5, datetime(2023, 1, 2, 8)),
+        ]
+    )
+    rows = bt.get_one_time_expenses()
+    assert [r[1] for r in rows] == ["Laptop", "Coffee"]
+    assert bt.one_time_total() == 1005
+
+
+def test_forecast_balances_matches_scalar():
+    accounts = [
+        (1000, 100, 0, 0, 0, 0),
+        (5000, 150, 19.99, 0, 0, 0),
+        (200000, 1500, 6.5, 300, 100, 200),
+    ]
+    expected = [
+        pytest.approx(budget_tool.account_balance_after_months(*a, 12))
+        for a in accounts
+    ]
+    assert budget_tool.forecast_balances(*zip(*accounts), 12) == expected
+    assert budget_tool.forecast_balances(*zip(*accounts), 0) == [
+        1000, 5000, 200000
+    ]
+
+
+def test_transaction_rolls_back_on_error(conn):
+    with pytest.raises(RuntimeError):
+        with budget_tool.transaction(conn):
+            conn.execute("INSERT INTO categories(name) VALUES('Temp')")
+            raise RuntimeError
+    assert not conn.in_transaction
+    row = conn.execute("SELECT 1 FROM categories WHERE name='Temp'")
+    assert row.fetchone() is None
+
+
+@pytest.mark.parametrize(
+    "args",
+    [(1000, 100, 0), (5000, 150, 19.99), (5000, 50, 24), (200000, 1500, 6.5, 300, 100, 200)],  # noqa: E501
+)
+def test_payoff_and_next_matches_separate_calls(args):
+    months, next_balance = budget_tool.payoff_and_next(*args)
+    assert months == budget_tool.months_to_payoff(*args)
+    assert next_balance == pytest.approx(
+        budget_tool.account_balance_after_months(*args)
+    )
+
+
+def test_user_id_cache_is_rebuilt_with_schema(bt, conn):
+    bt.add_user("alice")
+    alice = conn.execute("SELECT id FROM users WHERE username='alice'")
+    assert bt.get_user_id(conn, "alice") == alice.fetchone()[0]
+    bt.close_connection()
+    bt.DB_FILE.unlink()
+    bt._INITED.clear()
+    bt.init_db()
+    conn = bt.get_connection()
+    with pytest.raises(ValueError):
+        bt.get_user_id(conn, "alice")
+
+
+def test_add_category_if_missing(bt, conn):
+    assert bt.add_category_if_missing("Fuel") is True
+    assert bt.add_category_if_missing("Fuel") is False
+    count = conn.execute("SELECT COUNT(*) FROM categories WHERE name='Fuel'")
+    assert count.fetchone()[0] == 1
+
+
+@pytest.mark.parametrize(
+    "delete",
+    [
+        lambda bt: bt.delete_category("Misc"),
+        lambda bt: bt.update_categories(["Misc"]),
+    ],
+    ids=["delete_category", "update_categories"],
+)
+def test_category_delete_keeps_monthly_expense(bt, conn, delete):
+    bt.add_monthly_expense("Gym", 20, "Misc")
+    delete(bt)
+    rows = conn.execute("SELECT description, amount FROM monthly_expenses")
+    assert [tuple(r) for r in rows] == [("Gym", 20.0)]
+    tx = conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+    assert tx == 0
+
+
+def test_failed_delete_category_keeps_transactions(bt, conn):
+    bt.add_category("Dining")
+    bt.add_transaction("Dining", 12, "expense", "lunch")
+    bt.set_goal("Dining", 100)
+    # the goal's foreign key blocks the category delete
+    with pytest.raises(sqlite3.IntegrityError):
+        bt.delete_category("Dining")
+    tx = conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+    cats = conn.execute("SELECT COUNT(*) FROM categories WHERE name='Dining'")
+    assert tx == 1
+    assert cats.fetchone()[0] == 1
+
+
+def test_same_timestamp_rows_keep_insertion_order(bt, conn):
+    for i in range(5):
+        bt.add_transaction("Food", 1 + i, "expense", f"d{i}")
+    user_id = bt.get_user_id(conn, "default")
+    newest = conn.execute(bt._SQL_HISTORY_ALL, (user_id, 10)).fetchall()
+    oldest = conn.execute(bt._SQL_EXPORT, (user_id,)).fetchall()
+    expected = [f"d{i}" for i in range(5)]
+    assert [r["description"] for r in newest] == expected[::-1]
+    assert [r["description"] for r in oldest] == expected
+
+
+def test_implicit_categories_saved_without_autocommit(
+    bt, monkeypatch, capsys
+):
+    # DATABASE_URL connections use sqlite3's default transaction handling
+    monkeypatch.setattr(bt, "DATABASE_URL", f"sqlite://{bt.DB_FILE}")
+    assert bt.add_category_if_missing("Health") is True
+    bt.set_account("House", 1000, payment=100, acct_type="Mortgage")
+    bt.add_monthly_expense("Dentist", 30, "Dental")
+    out = capsys.readouterr().out
+    assert "Category 'Mortgage Payment' added." in out
+    assert "Category 'Dental' added." in out
+    check = sqlite3.connect(bt.DB_FILE)
+    names = {r[0] for r in check.execute("SELECT name FROM categories")}
+    tx = check.execute("SELECT description FROM transactions").fetchall()
+    check.close()
+    assert {"Health", "Mortgage Payment", "Dental"} <= names
+    assert sorted(r[0] for r in tx) == ["Dentist", "Payment for House"]
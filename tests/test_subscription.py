@@ -7,9 +7,7 @@ import budget_tool
 from datetime import datetime, timedelta
 
 
-def test_set_get_subscription(tmp_path):
-    budget_tool.DB_FILE = tmp_path / "budget.db"
-    budget_tool.init_db()
+def test_set_get_subscription(fresh_db):
     budget_tool.add_user("alice")
 
     budget_tool.set_subscription("alice", "premium")
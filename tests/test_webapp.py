@@ -1,24 +1,80 @@
+import re
+import shutil
 import sys
 from pathlib import Path
 import io
 
+import pytest
+
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
 import budget_tool
 import webapp
 
+_CSRF_RE = re.compile(rb'name="csrf_token" value="([^"]+)"')
+_LEFTOVER_RE = re.compile(rb'id="leftover"[^>]*>([0-9.,]+)</span>')
+_ADD_FIRST = b'name="add_0"'
+_LEFTOVER_ICON = (b'id="leftover-icon"', b"display:inline")
+
+
+@pytest.fixture(scope="module", autouse=True)
+def _warm_templates():
+    # compile every template once up front instead of on first render
+    env = webapp.app.jinja_env
+    auto_reload = env.auto_reload
+    env.auto_reload = False
+    for name in env.list_templates(extensions=["html"]):
+        env.get_template(name)
+    yield
+    env.auto_reload = auto_reload
+
+
+@pytest.fixture(autouse=True)
+def _no_csrf(monkeypatch):
+    # most tests don't exercise CSRF; skip the token round trip for them
+    monkeypatch.setitem(webapp.app.config, "WTF_CSRF_ENABLED", False)
+
+
+@pytest.fixture
+def csrf_enabled(monkeypatch):
+    """Turn CSRF protection back on for the requesting test."""
+    monkeypatch.setitem(webapp.app.config, "WTF_CSRF_ENABLED", True)
+
 
-def setup_app(tmp_path):
-    budget_tool.DB_FILE = tmp_path / "budget.db"
+@pytest.fixture
+def client(fresh_db):
+    """Return a test client backed by a fresh database."""
     webapp.setup_db()
     return webapp.app.test_client()
 
 
+@pytest.fixture(scope="module")
+def shared_db(schema_db, tmp_path_factory):
+    """Database built once per module for tests that only read from it."""
+    path = tmp_path_factory.mktemp("shared") / "budget.db"
+    shutil.copyfile(schema_db, path)
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(budget_tool, "DB_FILE", path)
+        webapp.setup_db()
+        budget_tool.set_account("Bank", 100, acct_type="Bank")
+        budget_tool.close_connection()
+    return path
+
+
+@pytest.fixture
+def read_client(shared_db, monkeypatch):
+    """Return a test client for the shared read-only database."""
+    monkeypatch.setattr(budget_tool, "DB_FILE", shared_db)
+    yield webapp.app.test_client()
+    budget_tool.close_connection()
+
+
 def get_csrf(client, path="/manage"):
+    if not webapp.app.config["WTF_CSRF_ENABLED"]:
+        return ""
     resp = client.get(path)
-    import re
-    match = re.search(r'name="csrf_token" value="([^"]+)"', resp.get_data(as_text=True))
-    return match.group(1) if match else None
+    match = _CSRF_RE.search(resp.data)
+    return match.group(1).decode() if match else None
 
 
 def login(client, monkeypatch):
@@ -32,8 +88,7 @@ def get_account_names(conn):
     return [r[0] for r in cur.fetchall()]
 
 
-def test_update_accounts_delete(tmp_path):
-    client = setup_app(tmp_path)
+def test_update_accounts_delete(client):
     # Add two accounts
     budget_tool.set_account("A1", 100, 10, "Bank")
     budget_tool.set_account("A2", 200, 20, "Bank")
@@ -62,8 +117,7 @@ def test_update_accounts_delete(tmp_path):
     assert names == ["A2"]
 
 
-def test_update_accounts_preserve_apr(tmp_path):
-    client = setup_app(tmp_path)
+def test_update_accounts_preserve_apr(client):
     # create account with interest
     budget_tool.set_account("Card", 800, 100, "Credit Card", apr=20)
 
@@ -90,17 +144,14 @@ def test_update_accounts_preserve_apr(tmp_path):
     assert months > months_no_interest
 
 
-def test_forecast_route(tmp_path, monkeypatch):
-    client = setup_app(tmp_path)
-    budget_tool.set_account("Bank", 100, acct_type="Bank")
-    login(client, monkeypatch)
-    resp = client.get("/forecast")
+def test_forecast_route(read_client, monkeypatch):
+    login(read_client, monkeypatch)
+    resp = read_client.get("/forecast")
     assert resp.status_code == 200
     assert b"Account Forecast" in resp.data
 
 
-def test_auto_scan_route(tmp_path, monkeypatch):
-    client = setup_app(tmp_path)
+def test_auto_scan_route(client, monkeypatch):
     login(client, monkeypatch)
     data1 = b"date,description,amount\n2023-01-01,Gym,-10\n"
     data2 = b"date,description,amount\n2023-02-01,Gym,-10\n"
@@ -120,7 +171,7 @@ def test_auto_scan_route(tmp_path, monkeypatch):
     )
     assert resp.status_code == 200
     assert b"Gym" in resp.data
-    assert b"name=\"add_0\"" in resp.data
+    assert _ADD_FIRST in resp.data
 
     save = {"desc_0": "Gym", "amt_0": "10", "add_0": "on", "csrf_token": token}
     client.post("/auto-scan", data=save)
@@ -131,11 +182,10 @@ def test_auto_scan_route(tmp_path, monkeypatch):
         data=dict(build_data(), csrf_token=token),
         content_type="multipart/form-data",
     )
-    assert b"name=\"add_0\"" not in resp2.data
+    assert _ADD_FIRST not in resp2.data
 
 
-def test_auto_scan_one_time(tmp_path, monkeypatch):
-    client = setup_app(tmp_path)
+def test_auto_scan_one_time(client, monkeypatch):
     login(client, monkeypatch)
     data1 = b"date,description,amount\n2023-01-01,Gym,-10\n2023-01-02,Coffee,-5\n"
     data2 = b"date,description,amount\n2023-02-01,Gym,-10\n"
@@ -162,8 +212,7 @@ def test_auto_scan_one_time(tmp_path, monkeypatch):
     assert budget_tool.monthly_expense_exists("Coffee")
 
 
-def test_delete_one_time(tmp_path, monkeypatch):
-    client = setup_app(tmp_path)
+def test_delete_one_time(client, monkeypatch):
     login(client, monkeypatch)
     from datetime import datetime
     budget_tool.add_one_time_expense("Temp", 5, datetime(2023, 1, 1))
@@ -174,8 +223,7 @@ def test_delete_one_time(tmp_path, monkeypatch):
     assert budget_tool.get_one_time_expenses() == []
 
 
-def test_auto_scan_ignore_duplicates(tmp_path, monkeypatch):
-    client = setup_app(tmp_path)
+def test_auto_scan_ignore_duplicates(client, monkeypatch):
     login(client, monkeypatch)
     data1 = b"date,description,amount\n2023-01-01,Item,-5\n"
     data2 = b"date,description,amount\n2023-02-01,Other,-2\n"
@@ -207,31 +255,28 @@ def test_auto_scan_ignore_duplicates(tmp_path, monkeypatch):
     assert len(rows) == 1
 
 
-def test_nav_contains_auto_scan(tmp_path):
-    client = setup_app(tmp_path)
-    resp = client.get("/")
+def test_nav_contains_auto_scan(read_client):
+    resp = read_client.get("/")
     assert resp.status_code == 200
     assert b"/auto-scan" in resp.data
 
 
-def test_nav_contains_budget(tmp_path):
-    client = setup_app(tmp_path)
-    resp = client.get("/")
+def test_nav_contains_budget(read_client):
+    resp = read_client.get("/")
     assert resp.status_code == 200
     assert b"/budget" in resp.data
 
 
-def test_protected_requires_login(tmp_path):
-    client = setup_app(tmp_path)
-    resp = client.get("/manage")
+def test_protected_requires_login(read_client):
+    resp = read_client.get("/manage")
     assert resp.status_code == 200
 
 
-def test_delete_monthly_expense(tmp_path):
-    client = setup_app(tmp_path)
-    budget_tool.add_category("Misc")
-    budget_tool.add_monthly_expense("Gym", 10)
-    budget_tool.add_transaction("Misc", 10, "expense", "Gym")
+def test_delete_monthly_expense(client, seed):
+    seed(
+        monthly_expenses=[("Gym", 10, "Misc")],
+        transactions=[("Misc", 10, "expense", "Gym")],
+    )
 
     token = get_csrf(client)
     resp = client.post("/delete-monthly/Gym", data={"csrf_token": token})
@@ -249,11 +294,8 @@ def test_delete_monthly_expense(tmp_path):
     conn.close()
 
 
-def test_delete_monthly_multiple(tmp_path):
-    client = setup_app(tmp_path)
-    budget_tool.add_category("Misc")
-    budget_tool.add_monthly_expense("Gym", 10)
-    budget_tool.add_monthly_expense("Net", 20)
+def test_delete_monthly_multiple(client, seed):
+    seed(monthly_expenses=[("Gym", 10, "Misc"), ("Net", 20, "Misc")])
     token = get_csrf(client, "/auto-scan")
     resp = client.post(
         "/delete-monthly",
@@ -263,8 +305,7 @@ def test_delete_monthly_multiple(tmp_path):
     assert budget_tool.get_monthly_expenses() == []
 
 
-def test_monthly_expense_creates_transaction(tmp_path):
-    _ = setup_app(tmp_path)
+def test_monthly_expense_creates_transaction(client):
     budget_tool.add_category("Misc")
     budget_tool.add_monthly_expense("Gym", 10)
 
@@ -276,8 +317,7 @@ def test_monthly_expense_creates_transaction(tmp_path):
     conn.close()
 
 
-def test_delete_transaction_removes_monthly(tmp_path):
-    client = setup_app(tmp_path)
+def test_delete_transaction_removes_monthly(client):
     budget_tool.add_category("Misc")
     budget_tool.add_monthly_expense("Gym", 10)
 
@@ -299,8 +339,7 @@ def test_delete_transaction_removes_monthly(tmp_path):
     conn.close()
 
 
-def test_monthly_income_routes(tmp_path, monkeypatch):
-    client = setup_app(tmp_path)
+def test_monthly_income_routes(client, monkeypatch):
     budget_tool.add_category("Job")
     login(client, monkeypatch)
     token = get_csrf(client)
@@ -316,11 +355,13 @@ def test_monthly_income_routes(tmp_path, monkeypatch):
     assert b"Salary" not in resp2.data
 
 
-def test_history_date_filter(tmp_path, monkeypatch):
-    client = setup_app(tmp_path)
-    budget_tool.add_category("Misc")
-    budget_tool.add_transaction("Misc", 5, "expense", "old")
-    budget_tool.add_transaction("Misc", 5, "expense", "new")
+def test_history_date_filter(client, monkeypatch, seed):
+    seed(
+        transactions=[
+            ("Misc", 5, "expense", "old"),
+            ("Misc", 5, "expense", "new"),
+        ]
+    )
     conn = budget_tool.get_connection()
     cur = conn.execute(
         "SELECT id FROM transactions WHERE description='old'"
@@ -346,8 +387,7 @@ def test_history_date_filter(tmp_path, monkeypatch):
     assert b"old" not in resp.data
 
 
-def test_csrf_required(tmp_path):
-    client = setup_app(tmp_path)
+def test_csrf_required(client, csrf_enabled):
     resp = client.post("/add-category", data={"name": "X"})
     assert resp.status_code == 400
     token = get_csrf(client)
@@ -355,10 +395,8 @@ def test_csrf_required(tmp_path):
     assert resp.status_code == 302
 
 
-def test_dashboard_data(tmp_path, monkeypatch):
-    client = setup_app(tmp_path)
-    budget_tool.add_category("Food")
-    budget_tool.add_transaction("Food", 10, "expense")
+def test_dashboard_data(client, monkeypatch, seed):
+    seed(transactions=[("Food", 10, "expense", None)])
     login(client, monkeypatch)
     resp = client.get("/dashboard-data")
     assert resp.status_code == 200
@@ -367,8 +405,7 @@ def test_dashboard_data(tmp_path, monkeypatch):
     assert data["categories"][0][0] == "Food"
 
 
-def test_budget_route(tmp_path, monkeypatch):
-    client = setup_app(tmp_path)
+def test_budget_route(client, monkeypatch):
     budget_tool.set_account("Loan", 1000, 50, "Loan")
     login(client, monkeypatch)
     resp = client.get("/budget")
@@ -376,18 +413,15 @@ def test_budget_route(tmp_path, monkeypatch):
     assert b"Budget" in resp.data
 
 
-def test_budget_excludes_bank(tmp_path, monkeypatch):
-    client = setup_app(tmp_path)
-    budget_tool.set_account("Checking", 100, 0, "Bank")
-    budget_tool.set_account("Loan", 500, 50, "Loan")
+def test_budget_excludes_bank(client, monkeypatch, seed):
+    seed(accounts=[("Checking", 100, 0, "Bank"), ("Loan", 500, 50, "Loan")])
     login(client, monkeypatch)
     resp = client.get("/budget")
     assert b"Checking" not in resp.data
     assert b"Loan" in resp.data
 
 
-def test_commit_extra_payment(tmp_path, monkeypatch):
-    client = setup_app(tmp_path)
+def test_commit_extra_payment(client, monkeypatch):
     budget_tool.set_account("Loan", 1000, 50, "Loan")
     login(client, monkeypatch)
     token = get_csrf(client, "/budget")
@@ -403,8 +437,7 @@ def test_commit_extra_payment(tmp_path, monkeypatch):
     assert loan["future"] == exp
 
 
-def test_update_extra_payment(tmp_path, monkeypatch):
-    client = setup_app(tmp_path)
+def test_update_extra_payment(client, monkeypatch):
     budget_tool.set_account("Loan", 1000, 50, "Loan")
     login(client, monkeypatch)
     token = get_csrf(client, "/budget")
@@ -431,13 +464,12 @@ def test_update_extra_payment(tmp_path, monkeypatch):
     )
 
 
-def test_budget_leftover_after_commit(tmp_path, monkeypatch):
-    client = setup_app(tmp_path)
-    budget_tool.add_category("Job")
-    budget_tool.add_category("Rent")
-    budget_tool.add_transaction("Job", 2000, "income", "Paycheck")
-    budget_tool.add_monthly_expense("Rent", 1000, "Rent")
-    budget_tool.set_account("Loan", 1000, 50, "Loan")
+def test_budget_leftover_after_commit(client, monkeypatch, seed):
+    seed(
+        transactions=[("Job", 2000, "income", "Paycheck")],
+        monthly_expenses=[("Rent", 1000, "Rent")],
+        accounts=[("Loan", 1000, 50, "Loan")],
+    )
     login(client, monkeypatch)
     token = get_csrf(client, "/budget")
     client.post(
@@ -445,29 +477,190 @@ def test_budget_leftover_after_commit(tmp_path, monkeypatch):
         data={"account": "Loan", "extra": "500", "csrf_token": token},
     )
     resp = client.get("/budget")
-    import re
-    match = re.search(r'id="leftover"[^>]*>([0-9.,]+)</span>', resp.get_data(as_text=True))
+    match = _LEFTOVER_RE.search(resp.data)
     assert match
-    leftover_val = float(match.group(1).replace(",", ""))
+    leftover_val = float(match.group(1).replace(b",", b""))
     assert leftover_val == 500.0
 
 
-def test_budget_leftover_classes(tmp_path, monkeypatch):
-    client = setup_app(tmp_path)
-    budget_tool.add_category("Job")
-    budget_tool.add_transaction("Job", 1000, "income", "Paycheck")
-    budget_tool.set_account("Loan", 1000, 50, "Loan")
+def test_budget_leftover_classes(client, monkeypatch, seed):
     # set extra to trigger warning
-    budget_tool.add_monthly_expense("Extra Payment - Loan", 850, "Extra Payment")
+    seed(
+        transactions=[("Job", 1000, "income", "Paycheck")],
+        monthly_expenses=[("Extra Payment - Loan", 850, "Extra Payment")],
+        accounts=[("Loan", 1000, 50, "Loan")],
+    )
     login(client, monkeypatch)
     resp = client.get("/budget")
     assert b'class="text-warning"' in resp.data
-    assert b'id="leftover-icon"' in resp.data
-    assert b'display:inline' in resp.data
+    assert all(m in resp.data for m in _LEFTOVER_ICON)
     # set extra to trigger danger
     budget_tool.add_monthly_expense("Extra Payment - Loan", 950, "Extra Payment")
     resp = client.get("/budget")
     assert b'class="text-danger"' in resp.data
-    assert b'id="leftover-icon"' in resp.data
-    assert b'display:inline' in resp.data
+    assert all(m in resp.data for m in _LEFTOVER_ICON)
+
+
+def test_history_json(client, monkeypatch, seed):
+    seed(transactions=[("Misc", 5, "expense", "snack")])
+    login(client, monkeypatch)
+    resp = client.get("/history.json")
+    assert resp.status_code == 200
+    rows = resp.get_json()
+    assert len(rows) == 1
+    assert rows[0]["name"] == "Misc"
+    assert rows[0]["description"] == "snack"
+    assert rows[0]["amount"] == 5
+
+
+def test_get_accounts_bundle(fresh_db, seed):
+    seed(
+        accounts=[
+            ("Checking", 500, 0, "Bank"),
+            ("Stocks", 250, 0, "Stock Account"),
+            ("Card", 300, 50, "Credit Card"),
+        ]
+    )
+    accounts, warnings, assets, total = webapp.get_accounts_bundle()
+    assert (accounts, warnings) == webapp.get_accounts()
+    assert assets == webapp.get_asset_accounts()
+    assert total == budget_tool.total_asset_balance() == 750
+
+
+def test_form_rows_groups_by_index():
+    from werkzeug.datastructures import MultiDict
+
+    form = MultiDict(
+        [
+            ("csrf_token", "x"),
+            ("delete", "A"),
+            ("old_10", "C"),
+            ("old_0", "A"),
+            ("name_0", "A2"),
+            ("old_2", "B"),
+        ]
+    )
+    assert webapp.form_rows(form) == [
+        {"old": "A", "name": "A2"},
+        {"old": "B"},
+        {"old": "C"},
+    ]
+
+
+def test_export_streams_csv(client, seed):
+    seed(transactions=[("Food", 10, "expense", "lunch")])
+    resp = client.get("/export")
+    assert resp.is_streamed
+    assert resp.data.startswith(b"category,amount,type")
+    assert b"Food,10.0,expense,lunch" in resp.data
+
+
+def test_manage_bundle_matches_helpers(fresh_db, seed):
+    seed(
+        transactions=[("Rent", 900, "expense", None)],
+        accounts=[("Checking", 1500, 0, "Bank")],
+    )
+    data = webapp.get_manage_bundle()
+    assert (data.income, data.expense, data.net) == webapp.get_totals()
+    assert data.bank_warning == budget_tool.months_until_bank_negative() == 2
+    assert data.total_assets == 1500
+
+
+def test_debug_query_counter_warns(client, monkeypatch, caplog):
+    monkeypatch.setattr(webapp, "QUERY_WARN_THRESHOLD", 1)
+    monkeypatch.setattr(webapp.app, "debug", True)
+    with caplog.at_level("WARNING", logger=webapp.app.logger.name):
+        client.get("/manage")
+    assert any("manage ran" in r.getMessage() for r in caplog.records)
+
+
+@pytest.mark.parametrize("value", [0, 5, -1234.5, 1234567.891])
+def test_fmt_filter_matches_budget_tool(value):
+    assert webapp.app.jinja_env.filters["fmt"](value) == budget_tool.fmt(value)
+
+
+def test_dashboard_data_etag(client, monkeypatch):
+    login(client, monkeypatch)
+    resp = client.get("/dashboard-data")
+    tag = resp.headers["ETag"]
+    cached = client.get("/dashboard-data", headers={"If-None-Match": tag})
+    assert cached.status_code == 304
+    client.post("/add-category", data={"name": "New"})
+    resp = client.get("/dashboard-data", headers={"If-None-Match": tag})
+    assert resp.status_code == 200
+    assert resp.headers["ETag"] != tag
+
+
+def test_update_categories_deletes_and_renames(client, seed):
+    seed(
+        categories=["Keep"],
+        transactions=[
+            ("Old", 5, "expense", "a"),
+            ("Gone", 7, "expense", "b"),
+        ],
+    )
+    client.post(
+        "/update-categories",
+        data={"delete": "Gone", "old_0": "Old", "name_0": "New"},
+    )
+    conn = budget_tool.get_connection()
+    names = [r[0] for r in conn.execute("SELECT name FROM categories")]
+    count = conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+    conn.close()
+    assert sorted(names) == ["Keep", "New"]
+    assert count == 1
+
+
+def test_get_db_shared_and_released(fresh_db):
+    with webapp.app.test_request_context("/"):
+        conn = webapp.get_db()
+        assert webapp.get_db() is conn
+        assert webapp._request_conn() is conn
+        request_g = webapp.g._get_current_object()
+    # close_db() released it when the app context was torn down
+    assert "_db" not in request_g
+
+
+def test_history_newest_first_within_same_timestamp(fresh_db, seed):
+    seed(transactions=[("Misc", 1, "expense", f"d{i}") for i in range(5)])
+    expected = [f"d{i}" for i in range(5)][::-1]
+    assert [r.description for r in webapp.get_history()] == expected
+    assert [r["description"] for r in webapp.get_expenses()] == expected
+
+
+@pytest.mark.parametrize("debug", [False, True])
+def test_orjson_provider_matches_default(monkeypatch, debug):
+    pytest.importorskip("orjson")
+    from flask.json.provider import DefaultJSONProvider
+
+    monkeypatch.setattr(webapp.app, "debug", debug)
+    stdlib = DefaultJSONProvider(webapp.app)
+    fast = webapp.ORJSONProvider(webapp.app)
+    data = {"net": 1.5, "accounts": [("A", 2)], "months": {2: "b", 1: "a"}}
+    with webapp.app.app_context():
+        assert fast.response(data).data == stdlib.response(data).data
+    assert fast.dumps(data, sort_keys=False) == stdlib.dumps(
+        data, sort_keys=False
+    )
+
 
+def test_account_pages_query_count_independent_of_accounts(
+    client, monkeypatch, caplog, seed
+):
+    monkeypatch.setattr(webapp, "QUERY_WARN_THRESHOLD", 0)
+    monkeypatch.setattr(webapp.app, "debug", True)
+
+    def statements(path):
+        caplog.clear()
+        with caplog.at_level("WARNING", logger=webapp.app.logger.name):
+            client.get(path)
+        (record,) = [r for r in caplog.records if " ran " in r.getMessage()]
+        return record.args[1]
+
+    seed(accounts=[("Loan0", 1000, 50, "Loan")])
+    budget_tool.add_monthly_expense("Extra Payment - Loan0", 25, "Extra Payment")
+    for path in ("/manage", "/forecast"):
+        statements(path)  # warm the cached user id
+        few = statements(path)
+        seed(accounts=[(f"Loan{i}", 1000, 50, "Loan") for i in range(1, 6)])
+        assert statements(path) == few
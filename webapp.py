@@ -1,6 +1,11 @@
 import io
 import budget_tool
 import os
+import threading
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from typing import Any
 from functools import wraps
 from api import bp as api_bp
@@ -13,9 +18,23 @@ from flask import (
     Response,
     session,
     jsonify,
+    g,
+    has_request_context,
+    make_response,
+    stream_with_context,
 )
+from flask.json.provider import DefaultJSONProvider
 from flask_wtf.csrf import CSRFProtect
 
+try:
+    from waitress import serve
+except Exception:  # pragma: no cover - optional dependency
+    serve = None
+try:
+    import orjson
+except Exception:  # pragma: no cover - optional dependency
+    orjson = None
+
 app = Flask(__name__)
 app.secret_key = os.environ.get("FLASK_SECRET_KEY", "devkey")
 app.config["SESSION_COOKIE_SECURE"] = (
@@ -24,16 +43,42 @@ app.config["SESSION_COOKIE_SECURE"] = (
 app.config["SESSION_COOKIE_SAMESITE"] = os.environ.get(
     "SESSION_COOKIE_SAMESITE", "Lax"
 )
+# reject oversized statement uploads before they are buffered
+app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024
 csrf = CSRFProtect(app)
 AUTH_ENABLED = os.environ.get("AUTH_ENABLED", "0") == "1"
 app.register_blueprint(api_bp, url_prefix="/api")
 csrf.exempt(api_bp)
 
 
-@app.template_filter("fmt")
-def fmt_filter(value: float) -> str:
-    """Jinja filter to format numbers with commas and two decimals."""
-    return budget_tool.fmt(value)
+class ORJSONProvider(DefaultJSONProvider):
+    """JSON provider that serializes responses with orjson.
+
+    Output matches the stdlib provider for ASCII data: keys are sorted,
+    non-string keys are accepted, and the compact or ``indent=2`` layouts
+    used by ``response()`` are reproduced. Any other json.dumps options
+    fall back to the stdlib provider.
+    """
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs == {"indent": 2}:
+            option |= orjson.OPT_INDENT_2
+        elif kwargs != {"separators": (",", ":")}:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+
+if orjson is not None:
+    app.json = ORJSONProvider(app)
+
+
+# Jinja filter formatting numbers like budget_tool.fmt; the bound str.format
+# runs in C, so templates skip a Python call for every amount they render
+fmt_filter = "{:,.2f}".format
+app.add_template_filter(fmt_filter, "fmt")
 
 
 def require_login(func):
@@ -47,80 +92,352 @@ def require_login(func):
     return wrapper
 
 
+# bumped after every successful write request; with the process start time
+# and the database file stamps it versions the data behind cached pages
+_DATA_VERSION = 0
+_DATA_VERSION_LOCK = threading.Lock()
+_PROCESS_TAG = f"{os.getpid():x}.{time.time_ns():x}"
+
+
+@app.after_request
+def bump_data_version(resp):
+    if request.method not in ("GET", "HEAD", "OPTIONS") and resp.status_code < 400:  # noqa: E501
+        global _DATA_VERSION
+        with _DATA_VERSION_LOCK:
+            _DATA_VERSION += 1
+    return resp
+
+
+def data_etag() -> str | None:
+    """Return an ETag for the current data, or None if it can't be versioned.
+
+    Writes made by this process bump ``_DATA_VERSION``; writes from other
+    processes, such as the CLI, change the size or mtime of the SQLite file
+    or its WAL, which are folded in as well.
+    """
+    if budget_tool.DATABASE_URL or budget_tool.SQLITE_KEY:
+        return None
+    parts = [_PROCESS_TAG, str(_DATA_VERSION), session.get("user") or ""]
+    for path in (str(budget_tool.DB_FILE), f"{budget_tool.DB_FILE}-wal"):
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        parts.append(f"{st.st_mtime_ns:x}.{st.st_size:x}")
+    return "-".join(parts)
+
+
+def etag_cached(view):
+    """Answer conditional GETs with 304 while the data is unchanged."""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        tag = data_etag()
+        if tag is None:
+            return view(*args, **kwargs)
+        if request.if_none_match.contains(tag):
+            resp = app.response_class(status=304)
+        else:
+            resp = make_response(view(*args, **kwargs))
+        resp.set_etag(tag)
+        # browsers must revalidate, which is cheap when the tag matches
+        resp.cache_control.private = True
+        resp.cache_control.no_cache = True
+        return resp
+
+    return wrapper
+
+
 def setup_db() -> None:
     """Initialize the database tables if they do not exist."""
     budget_tool.init_db()
 
 
-def get_categories():
-    conn = budget_tool.get_connection()
+# in debug mode, log requests that run more statements than this
+QUERY_WARN_THRESHOLD = 10
+
+
+def get_db():
+    """Return the connection shared by every helper used in this request.
+
+    It is opened on first use, so routes that never touch the database
+    skip the connection entirely.
+    """
+    db = getattr(g, "_db", None)
+    if db is None:
+        db = g._db = budget_tool.get_connection()
+        if app.debug and hasattr(db, "set_trace_callback"):
+            # helpers reuse this thread's cached connection, so the trace
+            # sees every statement the request runs
+            queries = g._queries = []
+            db.set_trace_callback(queries.append)
+    return db
+
+
+@app.before_request
+def count_queries():
+    """Start tracing statements up front when running in debug mode."""
+    if app.debug:
+        # the request context is gone by the time close_db() logs
+        g._endpoint = request.endpoint
+        get_db()
+
+
+@app.teardown_appcontext
+def close_db(exc):
+    db = g.pop("_db", None)
+    if db is None:
+        return
+    queries = g.pop("_queries", None)
+    if queries is not None:
+        db.set_trace_callback(None)
+        if len(queries) > QUERY_WARN_THRESHOLD:
+            sql, repeats = Counter(queries).most_common(1)[0]
+            app.logger.warning(
+                "%s ran %d SQL statements (%dx %r); possible N+1 query",
+                g.get("_endpoint") or "request",
+                len(queries),
+                repeats,
+                sql,
+            )
+    db.close()
+
+
+def _request_conn(conn=None):
+    """Return ``conn``, else get_db() when called during a request.
+
+    Lets the ``conn=None`` helpers below also run outside a request.
+    """
+    if conn is None and has_request_context():
+        conn = get_db()
+    return conn
+
+
+def form_rows(form) -> list[dict[str, str]]:
+    """Group ``field_N`` form keys into one dict per row, ordered by ``N``.
+
+    Keys without a numeric suffix (``delete``, ``csrf_token``) are ignored.
+    """
+    rows: dict[int, dict[str, str]] = {}
+    for key, value in form.items():
+        field, _, idx = key.rpartition("_")
+        if field and idx.isdigit():
+            rows.setdefault(int(idx), {})[field] = value
+    return [rows[i] for i in sorted(rows)]
+
+
+def _to_float(value: str | None, default: float | None = None):
+    """Convert a form value like ``request.form.get(type=float)`` does."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def get_categories(conn=None):
+    conn = _request_conn(conn)
+    own_conn = conn is None
+    if own_conn:
+        conn = budget_tool.get_connection()
     cur = conn.execute("SELECT name FROM categories ORDER BY name")
     categories = [row[0] for row in cur.fetchall()]
-    conn.close()
+    if own_conn:
+        conn.close()
     return categories
 
 
-def get_totals(user: str = "default"):
+def get_totals(user: str = "default", conn=None):
     """Return income, expense and net for the given user."""
-    return budget_tool.calc_totals(user)
+    return budget_tool.calc_totals(user, _request_conn(conn))
+
+
+def _account_info(r, extras: dict[str, float]) -> dict:
+    """Return the manage-page entry for one account row.
+
+    ``extras`` maps account names to extra payments, as returned by
+    budget_tool.get_extra_payments().
+    """
+    extra = extras.get(r.name) or 0.0
+    months, next_balance = budget_tool.payoff_and_next(
+        r.balance,
+        r.monthly_payment + extra,
+        r.apr,
+        r.escrow,
+        r.insurance,
+        r.tax,
+    )
+    return {
+        "name": r.name,
+        "balance": r.balance,
+        "payment": r.monthly_payment,
+        "type": r.type,
+        "apr": r.apr,
+        "escrow": r.escrow,
+        "insurance": r.insurance,
+        "tax": r.tax,
+        "months": months,
+        "extra": extra,
+        "increase": next_balance > r.balance,
+    }
+
+
+def get_accounts_bundle(conn=None):
+    """Return ``(accounts, warnings, assets, total_assets)`` in one pass.
+
+    Combines get_accounts(), get_asset_accounts() and
+    budget_tool.total_asset_balance() over a single account query.
+    """
+    conn = _request_conn(conn)
+    rows = budget_tool.get_all_accounts(conn)
+    extras = budget_tool.get_extra_payments(conn)
+    accounts: list[dict] = []
+    warnings: list[str] = []
+    assets: list[dict] = []
+    total_assets = 0.0
+    for r in rows:
+        info = _account_info(r, extras)
+        accounts.append(info)
+        if info["increase"]:
+            warnings.append(r.name)
+        if r.type in ("Bank", "Crypto Wallet", "Stock Account"):
+            assets.append(
+                {"name": r.name, "balance": r.balance, "type": r.type}
+            )
+            total_assets += r.balance
+    return accounts, warnings, assets, total_assets
 
 
-def get_accounts():
+def get_accounts(conn=None):
     """Return account info including payoff estimates and warnings."""
-    rows = budget_tool.get_all_accounts()
-    data: list[dict] = []
-    warnings: list[str] = []
-    for r in rows:
-        extra = (
-            budget_tool.get_monthly_expense_amount(f"Extra Payment - {r['name']}")
-            or 0.0
-        )
-        months = budget_tool.months_to_payoff(
-            r["balance"],
-            r["monthly_payment"] + extra,
-            r["apr"],
-            r["escrow"],
-            r["insurance"],
-            r["tax"],
-        )
-        next_balance = budget_tool.account_balance_after_months(
-            r["balance"],
-            r["monthly_payment"] + extra,
-            r["apr"],
-            r["escrow"],
-            r["insurance"],
-            r["tax"],
-            1,
-        )
-        increase = next_balance > r["balance"]
-        if increase:
-            warnings.append(r["name"])
-        data.append(
-            {
-                "name": r["name"],
-                "balance": r["balance"],
-                "payment": r["monthly_payment"],
-                "type": r["type"],
-                "apr": r["apr"],
-                "escrow": r["escrow"],
-                "insurance": r["insurance"],
-                "tax": r["tax"],
-                "months": months,
-                "extra": extra,
-                "increase": increase,
-            }
-        )
-    return data, warnings
+    conn = _request_conn(conn)
+    rows = budget_tool.get_all_accounts(conn)
+    extras = budget_tool.get_extra_payments(conn)
+    data = [_account_info(r, extras) for r in rows]
+    return data, [a["name"] for a in data if a["increase"]]
 
 
-def get_asset_accounts():
+def get_asset_accounts(conn=None):
     """Return accounts considered assets (bank, crypto and stock)."""
-    rows = budget_tool.get_all_accounts()
-    return [
-        {"name": r["name"], "balance": r["balance"], "type": r["type"]}
-        for r in rows
-        if r["type"] in ("Bank", "Crypto Wallet", "Stock Account")
-    ]
+    rows = budget_tool.get_asset_accounts_sql(_request_conn(conn))
+    return [dict(r) for r in rows]
+
+
+# totals and asset accounts for the overview page, tagged by ``kind``
+_SQL_OVERVIEW = """
+    SELECT 'tot' AS kind, type AS name, SUM(amount) AS value, NULL AS type
+    FROM transactions WHERE user_id = ? GROUP BY type
+    UNION ALL
+    SELECT 'acct', name, balance, type FROM accounts
+    WHERE type IN ('Bank', 'Crypto Wallet', 'Stock Account')
+    ORDER BY 1, 2
+"""
+
+
+def get_overview_data(user: str = "default", conn=None):
+    """Return income, expense, net and asset accounts in one query."""
+    conn = _request_conn(conn)
+    own_conn = conn is None
+    if own_conn:
+        conn = budget_tool.get_connection()
+    user_id = budget_tool.get_user_id(conn, user)
+    totals: dict[str, float] = {}
+    assets: list[dict] = []
+    for kind, name, value, acct_type in conn.execute(
+        _SQL_OVERVIEW, (user_id,)
+    ):
+        if kind == "tot":
+            totals[name] = value or 0
+        else:
+            assets.append({"name": name, "balance": value, "type": acct_type})
+    if own_conn:
+        conn.close()
+    income = totals.get("income", 0)
+    expense = totals.get("expense", 0)
+    return income, expense, income - expense, assets
+
+
+@dataclass
+class OverviewBundle:
+    """Everything the overview page renders."""
+
+    income: float
+    expense: float
+    net: float
+    assets: list[dict]
+    expenses: list
+
+
+def get_overview_bundle(user: str = "default", conn=None) -> OverviewBundle:
+    """Load the overview page's data over one connection."""
+    conn = _request_conn(conn)
+    own_conn = conn is None
+    if own_conn:
+        conn = budget_tool.get_connection()
+    income, expense, net, assets = get_overview_data(user, conn)
+    expenses = get_expenses(user=user, conn=conn)
+    if own_conn:
+        conn.close()
+    return OverviewBundle(income, expense, net, assets, expenses)
+
+
+@dataclass
+class ManageBundle:
+    """Everything the manage page renders."""
+
+    categories: list[str]
+    income: float
+    expense: float
+    net: float
+    accounts: list[dict]
+    payment_warnings: list[str]
+    assets: list[dict]
+    total_assets: float
+    bank_warning: int | None
+    goals: list[dict]
+    monthly_incomes: list[tuple[str, float]]
+
+
+def get_manage_bundle(user: str = "default", conn=None) -> ManageBundle:
+    """Load the manage page's data over one connection.
+
+    The totals are computed once and shared with the bank balance warning.
+    """
+    conn = _request_conn(conn)
+    own_conn = conn is None
+    if own_conn:
+        conn = budget_tool.get_connection()
+    categories = get_categories(conn)
+    income, expense, net = get_totals(user, conn)
+    accounts, warnings, assets, total_assets = get_accounts_bundle(conn)
+    bank_warning = budget_tool.months_until_bank_negative(
+        user, conn, net=net
+    )
+    if own_conn:
+        conn.close()
+    return ManageBundle(
+        categories,
+        income,
+        expense,
+        net,
+        accounts,
+        warnings,
+        assets,
+        total_assets,
+        bank_warning,
+        get_goals(user),
+        budget_tool.get_monthly_incomes(),
+    )
+
+
+HistoryRow = namedtuple(
+    "HistoryRow", "id name amount type description item_name created_at"
+)
+# rows fetched per round trip when loading history
+_HISTORY_BATCH = 200
+
+
+def _history_row(cursor, row) -> HistoryRow:
+    return HistoryRow._make(row)
 
 
 def get_history(
@@ -128,8 +445,12 @@ def get_history(
     user: str = "default",
     start: str | None = None,
     end: str | None = None,
+    conn=None,
 ):
-    conn = budget_tool.get_connection()
+    conn = _request_conn(conn)
+    own_conn = conn is None
+    if own_conn:
+        conn = budget_tool.get_connection()
     user_id = budget_tool.get_user_id(conn, user)
     query = (
         "SELECT t.id, c.name, t.amount, t.type, t.description, "
@@ -143,17 +464,25 @@ def get_history(
     if end:
         query += " AND t.created_at <= ?"
         params.append(end)
-    query += " ORDER BY t.created_at DESC LIMIT ?"
+    query += " ORDER BY t.created_at DESC, t.id DESC LIMIT ?"
     params.append(limit)
-    cur = conn.execute(query, params)
-    rows = cur.fetchall()
-    conn.close()
+    cur = conn.cursor()
+    cur.row_factory = _history_row
+    cur.execute(query, params)
+    rows: list[HistoryRow] = []
+    while chunk := cur.fetchmany(_HISTORY_BATCH):
+        rows.extend(chunk)
+    if own_conn:
+        conn.close()
     return rows
 
 
-def get_expenses(limit: int = 50, user: str = "default"):
+def get_expenses(limit: int = 50, user: str = "default", conn=None):
     """Return recent expense transactions."""
-    conn = budget_tool.get_connection()
+    conn = _request_conn(conn)
+    own_conn = conn is None
+    if own_conn:
+        conn = budget_tool.get_connection()
     user_id = budget_tool.get_user_id(conn, user)
     cur = conn.execute(
         """
@@ -162,13 +491,14 @@ def get_expenses(limit: int = 50, user: str = "default"):
         FROM transactions t
         JOIN categories c ON t.category_id = c.id
         WHERE t.user_id = ? AND t.type='expense'
-        ORDER BY t.created_at DESC
+        ORDER BY t.created_at DESC, t.id DESC
         LIMIT ?
         """,
         (user_id, limit),
     )
     rows = cur.fetchall()
-    conn.close()
+    if own_conn:
+        conn.close()
     return rows
 
 
@@ -179,13 +509,19 @@ def get_goals(user: str = "default"):
     return goals
 
 
-def get_category_expenses(user: str = "default"):
+def get_category_expenses(user: str = "default", conn=None):
     """Return total expenses per category for charts."""
-    conn = budget_tool.get_connection()
+    conn = _request_conn(conn)
+    own_conn = conn is None
+    if own_conn:
+        conn = budget_tool.get_connection()
     user_id = budget_tool.get_user_id(conn, user)
-    cur = conn.execute(
+    # plain tuples serialize straight to JSON
+    cur = conn.cursor()
+    cur.row_factory = None
+    cur.execute(
         """
-        SELECT c.name, SUM(t.amount) AS total
+        SELECT c.name, COALESCE(SUM(t.amount), 0) AS total
         FROM transactions t
         JOIN categories c ON t.category_id = c.id
         WHERE t.user_id=? AND t.type='expense'
@@ -194,38 +530,37 @@ def get_category_expenses(user: str = "default"):
         """,
         (user_id,),
     )
-    rows = [(r["name"], r["total"] or 0) for r in cur.fetchall()]
-    conn.close()
+    rows = cur.fetchall()
+    if own_conn:
+        conn.close()
     return rows
 
 
-def get_account_forecast(months: int = 1):
+def get_account_forecast(months: int = 1, conn=None):
     """Return forecasted balances for assets and debts."""
-    rows = budget_tool.get_all_accounts()
+    conn = _request_conn(conn)
+    rows = budget_tool.get_all_accounts(conn)
+    extras = budget_tool.get_extra_payments(conn)
+    payments = [r.monthly_payment + (extras.get(r.name) or 0.0) for r in rows]
+    futures = budget_tool.forecast_balances(
+        [r.balance for r in rows],
+        payments,
+        [r.apr for r in rows],
+        [r.escrow for r in rows],
+        [r.insurance for r in rows],
+        [r.tax for r in rows],
+        months,
+    )
     assets: list[dict] = []
     debts: list[dict] = []
-    for r in rows:
-        extra = (
-            budget_tool.get_monthly_expense_amount(f"Extra Payment - {r['name']}")
-            or 0.0
-        )
-        future = budget_tool.account_balance_after_months(
-            r["balance"],
-            r["monthly_payment"] + extra,
-            r["apr"],
-            r["escrow"],
-            r["insurance"],
-            r["tax"],
-            months,
-        )
-        change = future - r["balance"]
+    for r, future in zip(rows, futures):
         entry = {
-            "name": r["name"],
-            "type": r["type"],
+            "name": r.name,
+            "type": r.type,
             "future": future,
-            "change": change,
+            "change": future - r.balance,
         }
-        if r["type"] in ("Bank", "Crypto Wallet", "Stock Account"):
+        if r.type in ("Bank", "Crypto Wallet", "Stock Account"):
             assets.append(entry)
         else:
             debts.append(entry)
@@ -255,17 +590,16 @@ def logout():
 
 
 @app.route("/")
+@etag_cached
 def overview():
-    income, expense, net = get_totals()
-    assets = get_asset_accounts()
-    expenses = get_expenses()
+    data = get_overview_bundle()
     return render_template(
         "overview.html",
-        assets=assets,
-        income=income,
-        expense=expense,
-        net=net,
-        expenses=expenses,
+        assets=data.assets,
+        income=data.income,
+        expense=data.expense,
+        net=data.net,
+        expenses=data.expenses,
     )
 
 
@@ -277,6 +611,7 @@ def dashboard():
 
 @app.route("/dashboard-data")
 @require_login
+@etag_cached
 def dashboard_data():
     income, expense, net = get_totals()
     cat_data = get_category_expenses()
@@ -296,32 +631,26 @@ def dashboard_data():
 @app.route("/manage")
 @require_login
 def manage():
-    cats = get_categories()
-    income, expense, net = get_totals()
-    accounts, warnings = get_accounts()
-    assets = get_asset_accounts()
-    total_assets = budget_tool.total_asset_balance()
-    bank_warning = budget_tool.months_until_bank_negative()
-    goals = get_goals()
-    incomes = budget_tool.get_monthly_incomes()
+    data = get_manage_bundle()
     return render_template(
         "manage.html",
-        categories=cats,
-        income=income,
-        expense=expense,
-        net=net,
-        accounts=accounts,
-        assets=assets,
-        total_assets=total_assets,
-        bank_warning=bank_warning,
-        goals=goals,
-        monthly_incomes=incomes,
-        payment_warnings=warnings,
+        categories=data.categories,
+        income=data.income,
+        expense=data.expense,
+        net=data.net,
+        accounts=data.accounts,
+        assets=data.assets,
+        total_assets=data.total_assets,
+        bank_warning=data.bank_warning,
+        goals=data.goals,
+        monthly_incomes=data.monthly_incomes,
+        payment_warnings=data.payment_warnings,
     )
 
 
 @app.route("/forecast")
 @require_login
+@etag_cached
 def forecast_route():
     months = request.args.get("months", default=1, type=int)
     assets, debts = get_account_forecast(months)
@@ -381,41 +710,60 @@ def commit_extra():
     return redirect(url_for("budget_page"))
 
 
+# statement files parsed concurrently by /auto-scan
+_SCAN_WORKERS = 4
+
+
+def parse_upload(f) -> list[budget_tool.TransactionRecord]:
+    """Parse an uploaded statement straight from its stream."""
+    data = io.TextIOWrapper(f.stream, encoding="utf-8", newline="")
+    try:
+        return budget_tool.parse_statement_csv(data)
+    finally:
+        # leave the underlying stream open for Werkzeug to clean up
+        data.detach()
+
+
 @app.route("/auto-scan", methods=["GET", "POST"])
 @require_login
 def auto_scan():
     """Scan uploaded statements for recurring expenses."""
     results = None
+    expenses = None
     cats = get_categories()
     if request.method == "POST" and request.files:
-        statements = []
-        files = request.files.getlist("statement")
-        for f in files:
-            if not f or not f.filename:
-                continue
-            data = io.StringIO(f.read().decode("utf-8"))
-            statements.append(budget_tool.parse_statement_csv(data))
+        files = [f for f in request.files.getlist("statement") if f and f.filename]  # noqa: E501
+        if len(files) > 1:
+            workers = min(_SCAN_WORKERS, len(files))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                statements = list(pool.map(parse_upload, files))
+        else:
+            statements = [parse_upload(f) for f in files]
         found = budget_tool.find_recurring_expenses(statements, day_window=2)
-        existing = {d for d, _ in budget_tool.get_monthly_expenses()}
+        # one-time inserts below leave these untouched, so reuse them
+        expenses = budget_tool.get_monthly_expenses()
+        existing = {d for d, _ in expenses}
         results = [(d, a, c) for d, a, c in found if d not in existing]
         recurring_names = {d for d, _, _ in found}
-        for month in statements:
-            for r in month:
-                if r.amount < 0 and r.description not in recurring_names and r.description not in existing:
-                    budget_tool.add_one_time_expense(r.description, r.amount, r.date)
+        budget_tool.add_one_time_expenses_bulk(
+            (r.description, r.amount, r.date)
+            for month in statements
+            for r in month
+            if r.amount < 0
+            and r.description not in recurring_names
+            and r.description not in existing
+        )
     elif request.method == "POST":
-        i = 0
-        while True:
-            desc = request.form.get(f"desc_{i}")
-            if desc is None:
-                break
-            amt = request.form.get(f"amt_{i}", type=float)
-            cat = request.form.get(f"cat_{i}") or "Misc"
-            if request.form.get(f"add_{i}") == "on":
-                budget_tool.add_monthly_expense(desc, amt, cat)
-            i += 1
+        for row in form_rows(request.form):
+            if "desc" in row and row.get("add") == "on":
+                budget_tool.add_monthly_expense(
+                    row["desc"],
+                    _to_float(row.get("amt")),
+                    row.get("cat") or "Misc",
+                )
         results = []
-    expenses = budget_tool.get_monthly_expenses()
+    if expenses is None:
+        expenses = budget_tool.get_monthly_expenses()
     ones = budget_tool.get_one_time_expenses()
     one_total = budget_tool.one_time_total()
     from collections import defaultdict
@@ -508,16 +856,13 @@ def delete_category_route(name: str):
 
 @app.route("/update-categories", methods=["POST"])
 def update_categories_route():
-    deletes = request.form.getlist("delete")
-    for d in deletes:
-        budget_tool.delete_category(d)
-    for key in request.form:
-        if key.startswith("old_"):
-            idx = key[4:]
-            old = request.form[key]
-            new = request.form.get(f"name_{idx}")
-            if new and old and new != old:
-                budget_tool.rename_category(old, new)
+    renames = []
+    for row in form_rows(request.form):
+        old = row.get("old")
+        new = row.get("name")
+        if new and old and new != old:
+            renames.append((old, new))
+    budget_tool.update_categories(request.form.getlist("delete"), renames)
     return redirect(url_for("manage"))
 
 
@@ -526,41 +871,36 @@ def update_accounts_route():
     deletes = request.form.getlist("delete")
     for d in deletes:
         budget_tool.delete_account(d)
-    i = 0
-    while True:
-        old = request.form.get(f"old_{i}")
-        if old is None:
-            break
-        # Skip rows marked for deletion to avoid recreating them
-        if old in deletes:
-            i += 1
-            continue
-        name = request.form.get(f"name_{i}")
-        balance = request.form.get(f"balance_{i}", type=float)
-        payment = request.form.get(f"payment_{i}", type=float, default=0.0)
-        acct_type = request.form.get(f"type_{i}")
+    # Skip rows marked for deletion to avoid recreating them
+    rows = [
+        row
+        for row in form_rows(request.form)
+        if "old" in row and row["old"] not in deletes
+    ]
+    # APR and other fields are not part of the edit table; load them for
+    # every edited account in one query so they can be preserved
+    extras = {}
+    if rows:
+        olds = [row["old"] for row in rows]
+        cur = get_db().execute(
+            "SELECT name, apr, escrow, insurance, tax FROM accounts "
+            f"WHERE name IN ({','.join('?' * len(olds))})",
+            olds,
+        )
+        extras = {r[0]: tuple(r)[1:] for r in cur}
+    for row in rows:
+        old = row["old"]
+        name = row.get("name")
+        balance = _to_float(row.get("balance"))
+        payment = _to_float(row.get("payment"), 0.0)
+        acct_type = row.get("type")
         if name and balance is not None:
-            # Preserve APR and other fields not included in the edit table
-            conn = budget_tool.get_connection()
-            cur = conn.execute(
-                "SELECT apr, escrow, insurance, tax FROM accounts WHERE name=?",  # noqa: E501
-                (old,),
-            )
-            row = cur.fetchone()
-            conn.close()
-            if row is None:
-                apr = escrow = insurance = tax = 0.0
-            else:
-                apr = row["apr"]
-                escrow = row["escrow"]
-                insurance = row["insurance"]
-                tax = row["tax"]
+            apr, escrow, insurance, tax = extras.get(old, (0.0,) * 4)
             budget_tool.set_account(
                 name, balance, payment, acct_type, apr, escrow, insurance, tax
             )
             if name != old:
                 budget_tool.delete_account(old)
-        i += 1
     return redirect(url_for("manage"))
 
 
@@ -599,10 +939,7 @@ def set_account_route():
             name, balance, payment, acct_type, apr, escrow, insurance, tax
         )
         if acct_type == "Credit Card" and payment:
-            try:
-                budget_tool.add_category("Credit Card Payment")
-            except Exception:
-                pass
+            budget_tool.add_category_if_missing("Credit Card Payment")
             budget_tool.add_transaction(
                 "Credit Card Payment", payment, "expense", f"Payment for {name}"  # noqa: E501
             )
@@ -624,32 +961,71 @@ def history():
     return render_template("history.html", rows=rows)
 
 
+@app.route("/history.json")
+@require_login
+def history_json():
+    """Return the same rows as /history for client-side rendering."""
+    start = request.args.get("start")
+    end = request.args.get("end")
+    rows = get_history(start=start, end=end)
+    return jsonify([r._asdict() for r in rows])
+
+
 @app.route("/delete/<int:tid>", methods=["POST"])
 def delete_transaction(tid: int):
-    conn = budget_tool.get_connection()
-    cur = conn.execute("SELECT description FROM transactions WHERE id=?", (tid,))  # noqa: E501
-    row = cur.fetchone()
-    desc = row["description"] if row else None
-    conn.execute("DELETE FROM transactions WHERE id=?", (tid,))
-    conn.commit()
-    conn.close()
-    if desc:
-        budget_tool.delete_monthly_expense(desc)
+    conn = get_db()
+    with budget_tool.transaction(conn):
+        row = conn.execute(
+            "SELECT description FROM transactions WHERE id=?", (tid,)
+        ).fetchone()
+        conn.execute("DELETE FROM transactions WHERE id=?", (tid,))
+        if row and row["description"]:
+            # drop the matching monthly expense, if any; its trigger
+            # removes the other transactions recorded for it
+            conn.execute(
+                "DELETE FROM monthly_expenses WHERE description=?",
+                (row["description"],),
+            )
     return redirect(url_for("history"))
 
 
 @app.route("/export")
 def export_csv_route():
-    data = budget_tool.export_csv_string()
-    resp = Response(data, mimetype="text/csv")
+    # stream batches as they are read instead of building the whole file
+    rows = stream_with_context(budget_tool.iter_export_csv())
+    resp = Response(rows, mimetype="text/csv")
     resp.headers["Content-Disposition"] = "attachment; filename=transactions.csv"  # noqa: E501
     return resp
 
 
-def main():
+def main_dev():
+    """Run Flask's development server with the debugger and reloader."""
     setup_db()
     app.run(debug=True)
 
 
+def main():
+    """Serve the app with waitress, or Flask's server if it is missing."""
+    setup_db()
+    if serve is None:
+        app.run(
+            debug=os.environ.get("FLASK_DEBUG", "0") == "1",
+            threaded=True,
+            use_reloader=False,
+        )
+        return
+    serve(
+        app,
+        host=os.environ.get("HOST", "127.0.0.1"),
+        port=int(os.environ.get("PORT", "5000")),
+        # each thread keeps its own SQLite connection
+        threads=int(os.environ.get("THREADS", "8")),
+    )
+
+
+# conventional name looked up by WSGI servers, e.g. gunicorn webapp:application
+application = app
+
+
 if __name__ == "__main__":
     main()